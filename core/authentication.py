@@ -0,0 +1,76 @@
+import threading
+import time
+from django.conf import settings
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+
+class UserCache:
+    """
+    Short-lived in-process cache of authenticated users, keyed by user id.
+    Ids are compared as strings since tokens may carry them either way.
+
+    Entries expire after AUTH_USER_CACHE_TIMEOUT seconds. core.signals evicts
+    a user as soon as their row, groups or permissions change in this process;
+    other processes pick the change up when their entry expires.
+    """
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, user_id):
+        user_id = str(user_id)
+        entry = self.entries.get(user_id)
+        if entry is None:
+            return None
+        (expires_at, user) = entry
+        if expires_at < time.monotonic():
+            self.evict(user_id)
+            return None
+        return user
+
+    def set(self, user_id, user):
+        with self.lock:
+            if len(self.entries) >= self.max_entries:
+                self.entries.clear()
+            self.entries[str(user_id)] = (time.monotonic() + settings.AUTH_USER_CACHE_TIMEOUT, user)
+
+    def evict(self, user_id):
+        with self.lock:
+            self.entries.pop(str(user_id), None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication (JWTAuthentication):
+    """
+    JWTAuthentication that reads the user from `user_cache` instead of
+    loading core.User on every request. The same User object (with Django's
+    permission cache on it) is reused until it is evicted or expires.
+    """
+
+    def get_user(self, validated_token):
+        user_id = validated_token.get(api_settings.USER_ID_CLAIM)
+        user = user_cache.get(user_id) if user_id is not None else None
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(user_id, user)
+            return user
+
+        # The checks JWTAuthentication runs on a freshly loaded user
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        if getattr(api_settings, 'CHECK_REVOKE_TOKEN', False):
+            from rest_framework_simplejwt.utils import get_md5_hash_password
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+                raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+        return user
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+# Permission sets are cached per user in the shared Django cache. Every key
+# embeds a global permissions version, which core.signals bumps when a
+# group's permissions change (that affects every member); changes to one
+# user's groups or permissions only drop that user's entry.
+
+PERMISSIONS_VERSION_KEY = 'core:permissions:version'
+
+
+def permissions_cache_key(user_id):
+    version = cache.get_or_set(PERMISSIONS_VERSION_KEY, 1, timeout=None)
+    return f'core:permissions:{version}:{user_id}'
+
+
+def forget_permissions(user_id):
+    cache.delete(permissions_cache_key(user_id))
+
+
+def forget_all_permissions():
+    try:
+        cache.incr(PERMISSIONS_VERSION_KEY)
+    except ValueError:
+        cache.set(PERMISSIONS_VERSION_KEY, 2, timeout=None)
+
+
+class CachedModelBackend (ModelBackend):
+    """ModelBackend whose per-user permission sets come from the cache."""
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return super().get_all_permissions(user_obj, obj)
+        if not hasattr(user_obj, '_perm_cache'):
+            key = permissions_cache_key(user_obj.pk)
+            permissions = cache.get(key)
+            if permissions is None:
+                permissions = super().get_all_permissions(user_obj)
+                cache.set(key, permissions, settings.PERMISSIONS_CACHE_TIMEOUT)
+            user_obj._perm_cache = permissions
+        return user_obj._perm_cache
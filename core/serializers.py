@@ -1,5 +1,6 @@
 from djoser.serializers import UserCreateSerializer as BaseUserCreateSerializer, UserSerializer as BaseUserSerailizer
 from store.models import Customer
+from store.customers import cache_customer_id
 
 class UserCreateSerializer (BaseUserCreateSerializer):
     class Meta(BaseUserCreateSerializer.Meta):
@@ -8,7 +9,8 @@ class UserCreateSerializer (BaseUserCreateSerializer):
     def save (self, **kwargs):
         user = super().save(**kwargs)
         # print(user.email)
-        Customer.objects.create(user=user)
+        customer = Customer.objects.create(user=user)
+        cache_customer_id(user.id, customer.id)
         return user
         
 class UserSerializer(BaseUserSerailizer):
@@ -0,0 +1,38 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .authentication import user_cache
+from .backends import forget_permissions, forget_all_permissions
+from .models import User
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def evict_cached_user(sender, instance, **kwargs):
+    user_cache.evict(instance.pk)
+    forget_permissions(instance.pk)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def evict_user_with_changed_permissions(sender, instance, reverse, model, pk_set, **kwargs):
+    if reverse:
+        # Changed from the group/permission side: instance is not a user
+        if model is User and pk_set:
+            for user_id in pk_set:
+                user_cache.evict(user_id)
+                forget_permissions(user_id)
+        else:
+            user_cache.clear()
+            forget_all_permissions()
+    else:
+        user_cache.evict(instance.pk)
+        forget_permissions(instance.pk)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+@receiver(post_delete, sender=Group)
+def clear_user_cache(sender, **kwargs):
+    # A group's permissions apply to all of its members
+    user_cache.clear()
+    forget_all_permissions()
@@ -1,3 +1,72 @@
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache
 from django.test import TestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from .authentication import user_cache
+from .models import User
 
 # Create your tests here.
+
+
+class CachedJWTAuthenticationTest (TestCase):
+    def setUp(self):
+        cache.clear()
+        user_cache.clear()
+        self.user = User.objects.create_user(username='user', email='user@example.com', password='secret')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def user_queries(self, context):
+        return [query for query in context.captured_queries if 'FROM "core_user"' in query['sql']]
+
+    def test_user_is_loaded_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get('/store/orders/')
+        with self.assertNumQueries(1) as context:
+            # Only the order query; the user and its customer id are cached
+            self.assertEqual(self.client.get('/store/orders/').status_code, 200)
+        self.assertEqual(self.user_queries(context), [])
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get('/store/orders/')
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get('/store/orders/').status_code, 401)
+
+    def test_staff_change_is_seen_at_once(self):
+        self.client.get('/store/orders/')
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get('/store/orders/')
+        self.assertTrue(user_cache.get(self.user.pk).is_staff)
+
+
+class CachedPermissionsTest (TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='user', email='user@example.com')
+        self.group = Group.objects.create(name='Support')
+        self.user.groups.add(self.group)
+        self.permission = Permission.objects.get(codename='view_history')
+
+    def has_perm(self):
+        # A fresh user object, as every request without the user cache gets
+        return User.objects.get(pk=self.user.pk).has_perm('store.view_history')
+
+    def test_permissions_are_cached_across_user_objects(self):
+        self.assertFalse(self.has_perm())
+        user = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertFalse(user.has_perm('store.view_history'))
+
+    def test_group_permission_change_invalidates(self):
+        self.assertFalse(self.has_perm())
+        self.group.permissions.add(self.permission)
+        self.assertTrue(self.has_perm())
+
+    def test_user_group_change_invalidates(self):
+        self.group.permissions.add(self.permission)
+        self.assertTrue(self.has_perm())
+        self.user.groups.remove(self.group)
+        self.assertFalse(self.has_perm())
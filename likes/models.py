@@ -11,4 +11,10 @@ class LikedItem (models.Model):
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
+
+    class Meta:
+        indexes = [
+            # Reverse lookups: the likes of one object, Product.likes counts
+            models.Index(fields=['content_type', 'object_id']),
+        ]
  
\ No newline at end of file
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.0/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 
@@ -97,6 +99,104 @@ DATABASES = {
     }
 }
 
+# The test suite (including the store query-budget benchmarks) runs against
+# SQLite so it can be executed without a MySQL server.
+# The test database is a file (not shared-cache memory) and transactions take
+# the write lock up front, so the concurrent checkout benchmark waits for the
+# lock instead of failing with "database table is locked".
+if 'test' in sys.argv:
+    DATABASES['default'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+        },
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+# The catalog versions (store/cache.py), customer ids (store/customers.py) and
+# permission sets (core/backends.py) are invalidated by whichever process
+# handles the write, so the cache must be shared by every worker, and it must
+# cost no SQL query: it lives in Redis, at REDIS_URL.
+# Without REDIS_URL the tests use a per-process memory cache, which issues no
+# queries either; set it to run the suite (and its query budgets) against a
+# real Redis server. The tests flush that database.
+REDIS_URL = os.environ.get('REDIS_URL')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL or 'redis://127.0.0.1:6379/1',
+    }
+}
+
+if 'test' in sys.argv and REDIS_URL is None:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+
+# Seconds a cached product/collection response is kept (see store/cache.py)
+CATALOG_CACHE_TIMEOUT = 300
+
+
+# Seconds a cart may go without item changes before `python manage.py
+# reap_carts` deletes it (see store/carts.py)
+CART_TTL = 60 * 60 * 24 * 30
+
+
+# Seconds a user's customer id is cached (see store/customers.py)
+CUSTOMER_CACHE_TIMEOUT = 60 * 60 * 24
+
+
+# Sales tax added to product prices (see store/pricing.py)
+TAX_RATE = '0.10'
+
+
+# Background jobs (see store/jobs.py, run with `python manage.py run_jobs`)
+
+# Seconds after which a running job whose worker died is picked up again
+JOB_TIMEOUT = 600
+
+# When True, POST /store/orders/ queues the checkout and answers 202 with the
+# order id; the order's payment_status moves from Queued to Pending (or
+# Failed) once a run_jobs worker has finalized it
+ASYNC_CHECKOUT = False
+
+# Bulk product admin actions (see store/bulk.py) update this many rows per
+# transaction, and hand selections of more than
+# BULK_ACTION_BACKGROUND_THRESHOLD products to the run_jobs worker, in jobs
+# of at most that many products
+BULK_ACTION_CHUNK_SIZE = 1000
+BULK_ACTION_BACKGROUND_THRESHOLD = 10000
+
+# Rows read per query by the streaming exports (see store/export.py)
+EXPORT_CHUNK_SIZE = 2000
+
+# Records validated and written per transaction by the catalog import (see
+# store/catalog_import.py)
+IMPORT_BATCH_SIZE = 1000
+
+
+# Admin changelists of tables with at least this many rows show the row count
+# estimated by the database statistics instead of running COUNT(*) (see
+# store/pagination.py)
+ADMIN_ESTIMATED_COUNT_THRESHOLD = 100000
+
+
+AUTHENTICATION_BACKENDS = [
+    'core.backends.CachedModelBackend',
+]
+
+# Seconds a user's permission set is cached (see core/backends.py)
+PERMISSIONS_CACHE_TIMEOUT = 60 * 60
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -143,7 +243,7 @@ REST_FRAMEWORK ={
     'COERCE_DECIMAL_TO_STRING':False,
     'PAGE_SIZE': 10,
      'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'core.authentication.CachedJWTAuthentication',
         
     ),
     # 'DEFAULT_PERMISSION_CLASSES':{
@@ -166,3 +266,10 @@ SIMPLE_JWT = {
     'AUTH_HEADER_TYPES': ('Bearer',),
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1)
 }
+
+# Seconds an authenticated user is kept in each process's user cache (see
+# core/authentication.py). Changes to a user, their groups or permissions are
+# seen at once by the process that made them and by every other process
+# within this many seconds; deactivating a user therefore revokes their
+# access tokens within the same bound.
+AUTH_USER_CACHE_TIMEOUT = 60
@@ -1,11 +1,16 @@
 from typing import Any
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
 from django.db.models.query import QuerySet
-from django.db.models import Count
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
 from django.http import HttpRequest
 from django.utils.html import format_html, urlencode
 from django.urls import reverse 
 from . import models
+from .bulk import BulkOperationError, run_bulk_operation
+from .pagination import EstimatedCountPaginator
 
 
 # Register your models here.
@@ -24,25 +29,31 @@ class InventoryFilter (admin.SimpleListFilter):
 
 @admin.register(models.Collection)
 class CollectionAdmin (admin.ModelAdmin):
-    list_display = ['title', 'products_count']
+    # Not named products_count: list_display would resolve that to the
+    # model field and show the bare number instead of the link
+    list_display = ['title', 'products_link']
     search_fields=['title']
 
-    @admin.display(ordering='products_count')
-    def products_count(self, collection):
+    @admin.display(description='products count', ordering='products_count')
+    def products_link(self, collection):
         url = reverse('admin:store_product_changelist') + '?' + urlencode({
             'collection__id': str(collection.id)
         })
 
         return format_html('<a href="{}">{}</a>', url, collection.products_count)
 
-    def get_queryset(self, request) :
-        return super().get_queryset(request).annotate(
-            products_count=Count('product')
-        )
+class ProductActionForm (ActionForm):
+    # Parameters of the bulk actions, shown next to the action dropdown
+    percent = forms.DecimalField(required=False, min_value=-99, max_value=1000, decimal_places=2,
+                                 help_text='Price change in percent')
+    promotion = forms.ModelChoiceField(models.Promotion.objects.all(), required=False)
+    inventory = forms.IntegerField(required=False, min_value=0)
+
 
 @admin.register(models.Product)
 class ProductAdmin(admin.ModelAdmin):
-    actions=['clear_inventory']
+    actions=['clear_inventory', 'set_inventory', 'adjust_price', 'assign_promotion']
+    action_form = ProductActionForm
     autocomplete_fields=['collection']
     # fields=['title', 'slug']
     exclude=['promotions']
@@ -55,6 +66,8 @@ class ProductAdmin(admin.ModelAdmin):
     list_per_page = 10
     list_select_related= ['collection']
     list_filter=['collection', 'last_update', InventoryFilter]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
     def inventory_status(self, product):
         if product.inventory < 10:
@@ -65,19 +78,58 @@ class ProductAdmin(admin.ModelAdmin):
     def collection_title (self, product):
         return product.collection.title
     
+    def run_bulk_action(self, request, queryset, operation, **params):
+        try:
+            result = run_bulk_operation(operation, queryset, **params)
+        except BulkOperationError as error:
+            self.message_user(request, str(error), messages.ERROR)
+            return
+        if isinstance(result, list):
+            ids = ', '.join(str(job.id) for job in result)
+            self.message_user(request, f'The products are being updated in the background (jobs {ids})')
+        else:
+            self.message_user(request, f'{result} products were successfully updated')
+
+    def action_parameter(self, request, name):
+        form = self.action_form(request.POST)
+        form.fields['action'].choices = self.get_action_choices(request)
+        if not form.is_valid() or form.cleaned_data[name] is None:
+            self.message_user(request, f'Enter a valid {name} for this action', messages.ERROR)
+            return None
+        return form.cleaned_data[name]
+
     @admin.action(description='Clear inventory')
     def clear_inventory(self, request, queryset:QuerySet):
-        updated_count = queryset.update(inventory = 0)
-        self.message_user(request, f'{updated_count} products were succesfulled updatediii')
+        self.run_bulk_action(request, queryset, 'set_inventory', inventory=0)
+
+    @admin.action(description='Set inventory')
+    def set_inventory(self, request, queryset:QuerySet):
+        inventory = self.action_parameter(request, 'inventory')
+        if inventory is not None:
+            self.run_bulk_action(request, queryset, 'set_inventory', inventory=inventory)
+
+    @admin.action(description='Adjust price by percent')
+    def adjust_price(self, request, queryset:QuerySet):
+        percent = self.action_parameter(request, 'percent')
+        if percent is not None:
+            self.run_bulk_action(request, queryset, 'adjust_price', percent=str(percent))
+
+    @admin.action(description='Assign promotion')
+    def assign_promotion(self, request, queryset:QuerySet):
+        promotion = self.action_parameter(request, 'promotion')
+        if promotion is not None:
+            self.run_bulk_action(request, queryset, 'assign_promotion', promotion_id=promotion.id)
 
 
 
 @admin.register(models.Customer)
 class CustomerAdmin(admin.ModelAdmin):
     list_display = ['first_name', 'last_name', 'membership', 'orders_count']
-    search_fields=['first_name__istartswith']
+    search_fields=['user__first_name__istartswith']
     list_select_related = ['user']
     ordering = ['user__first_name', 'user__last_name']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     
     def orders_count(self, customer):
         url = reverse('admin:store_order_changelist') + '?' + urlencode({
@@ -88,16 +140,28 @@ class CustomerAdmin(admin.ModelAdmin):
 
  
     def get_queryset(self, request) :
+        # A correlated count runs for the rows of the page only, where a
+        # Count('order') join would group the whole order table
+        orders = models.Order.objects \
+            .filter(customer=OuterRef('pk')) \
+            .order_by() \
+            .values('customer') \
+            .annotate(count=Count('*')) \
+            .values('count')
         return super().get_queryset(request).annotate(
-            orders_count = Count('order')
+            orders_count = Coalesce(Subquery(orders, output_field=IntegerField()), Value(0))
         )
 
 
 @admin.register(models.Order)
 class OrderAdmin (admin.ModelAdmin):
     list_display = ['payment_status','placed_at', 'customer_name']
-    list_select_related = ['customer']
+    # customer_name reads the name from the customer's user
+    list_select_related = ['customer__user']
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
+    @admin.display(ordering='customer__user__first_name')
     def customer_name (self, order):
         return order.customer.first_name
 
@@ -0,0 +1,145 @@
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.db.models.functions import Round
+from django.utils import timezone
+from .jobs import enqueue, job_handler, report_progress
+from .models import Product
+
+# Bulk product updates for the admin. A selection is processed in chunks of
+# primary keys, in pk order, each chunk in its own short transaction, so no
+# statement locks more than BULK_ACTION_CHUNK_SIZE rows and readers see the
+# catalog move forward chunk by chunk. Every operation sets last_update,
+# because queryset updates send no signals; that retires the catalog
+# responses of the updated products as their chunk commits.
+#
+# An operation is a function of (ids, **params) registered with
+# @bulk_operation; params must be JSON serializable so the selection can be
+# handed to the run_jobs worker. An operation can also register a check of
+# (queryset, **params) that raises BulkOperationError before anything is
+# written, so a run never fails halfway on data the selection already holds.
+
+BULK_OPERATIONS = {}
+BULK_CHECKS = {}
+
+
+class BulkOperationError (Exception):
+    pass
+
+
+def bulk_operation(name, check=None):
+    def decorator(func):
+        BULK_OPERATIONS[name] = func
+        if check is not None:
+            BULK_CHECKS[name] = check
+        return func
+    return decorator
+
+
+def adjusted_price(percent):
+    factor = 1 + Decimal(percent) / 100
+    price = ExpressionWrapper(F('unit_price') * factor, output_field=DecimalField(max_digits=6, decimal_places=2))
+    return Round(price, 2)
+
+
+def check_adjusted_price(queryset, percent):
+    field = Product._meta.get_field('unit_price')
+    highest = Decimal(10) ** (field.max_digits - field.decimal_places) - Decimal(10) ** -field.decimal_places
+    too_high = queryset.alias(adjusted_price=adjusted_price(percent)).filter(adjusted_price__gt=highest)
+    if too_high.exists():
+        raise BulkOperationError(f'The adjusted price of some products would exceed {highest}')
+
+
+@bulk_operation('adjust_price', check=check_adjusted_price)
+def adjust_price(ids, percent):
+    return Product.objects \
+        .filter(pk__in=ids) \
+        .update(unit_price=adjusted_price(percent), last_update=timezone.now())
+
+
+@bulk_operation('set_inventory')
+def set_inventory(ids, inventory):
+    return Product.objects \
+        .filter(pk__in=ids) \
+        .update(inventory=inventory, last_update=timezone.now())
+
+
+@bulk_operation('assign_promotion')
+def assign_promotion(ids, promotion_id):
+    Through = Product.promotions.through
+    Through.objects.bulk_create(
+        [Through(product_id=product_id, promotion_id=promotion_id) for product_id in ids],
+        ignore_conflicts=True
+    )
+    return Product.objects \
+        .filter(pk__in=ids) \
+        .update(last_update=timezone.now())
+
+
+def pk_chunks(queryset, size):
+    """Yield the primary keys of `queryset` in pk order, `size` at a time."""
+    queryset = queryset.order_by('pk').values_list('pk', flat=True)
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(pk__gt=last)
+        ids = list(page[:size])
+        if not ids:
+            return
+        yield ids
+        last = ids[-1]
+
+
+def apply_in_chunks(operation, chunks, params, total, progress=None):
+    """
+    Run `operation` over `chunks` of product ids, one transaction per chunk.
+
+    `progress(processed, total)` is called after every chunk. A failure
+    stops the run; the chunks committed before it stay applied. Returns the
+    number of products updated.
+    """
+    func = BULK_OPERATIONS[operation]
+    processed = updated = 0
+    for ids in chunks:
+        with transaction.atomic():
+            updated += func(ids, **params)
+        processed += len(ids)
+        if progress is not None:
+            progress(processed, total)
+    return updated
+
+
+def run_bulk_operation(operation, queryset, **params):
+    """
+    Apply `operation` to the products of `queryset`.
+
+    Selections of up to BULK_ACTION_BACKGROUND_THRESHOLD products are updated
+    in this process and the number of updated products is returned; larger
+    ones are queued for the run_jobs worker, as one Job per
+    BULK_ACTION_BACKGROUND_THRESHOLD products so no payload grows with the
+    selection, and the list of Jobs is returned. Raises BulkOperationError
+    when the operation's check rejects the selection.
+    """
+    if operation not in BULK_OPERATIONS:
+        raise LookupError(f'Unknown bulk operation {operation}')
+    if operation in BULK_CHECKS:
+        BULK_CHECKS[operation](queryset, **params)
+    total = queryset.count()
+    if total > settings.BULK_ACTION_BACKGROUND_THRESHOLD:
+        with transaction.atomic():
+            return [
+                enqueue('bulk_products', operation=operation, ids=ids, params=params)
+                for ids in pk_chunks(queryset, settings.BULK_ACTION_BACKGROUND_THRESHOLD)
+            ]
+    return apply_in_chunks(operation, pk_chunks(queryset, settings.BULK_ACTION_CHUNK_SIZE), params, total)
+
+
+@job_handler('bulk_products')
+def run_bulk_job(operation, ids, params):
+    size = settings.BULK_ACTION_CHUNK_SIZE
+    chunks = (ids[start:start + size] for start in range(0, len(ids), size))
+    updated = apply_in_chunks(
+        operation, chunks, params, len(ids),
+        progress=lambda processed, total: report_progress(processed=processed, total=total)
+    )
+    return {'operation': operation, 'updated': updated, 'total': len(ids)}
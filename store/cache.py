@@ -0,0 +1,130 @@
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from hashlib import md5
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Max
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.response import Response
+
+# Read-through cache and conditional GETs for catalog (product and
+# collection) responses. Both are keyed on validators:
+#   product detail  the product's last_update alone
+#   lists           Max(last_update) of the products the response depends
+#                   on, plus the catalog version
+# Every write that changes what a product shows moves its last_update
+# (touch_products), so it only retires that product's own detail response and
+# the lists. The catalog version is bumped (invalidate_catalog) only for what
+# a Max(last_update) cannot see: deleted products, products moving between
+# collections and collection writes. It is a millisecond timestamp, so it
+# never repeats after the cache is flushed and doubles as the catalog's last
+# modification time.
+
+CATALOG_VERSION_KEY = 'store:catalog:version'
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def get_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        version = now_ms()
+        if not cache.add(CATALOG_VERSION_KEY, version, timeout=None):
+            version = cache.get(CATALOG_VERSION_KEY, version)
+    return version
+
+
+def bump_catalog_version():
+    version = cache.get(CATALOG_VERSION_KEY) or 0
+    cache.set(CATALOG_VERSION_KEY, max(version + 1, now_ms()), timeout=None)
+
+
+def invalidate_catalog():
+    """Retire every cached catalog list response after the current transaction."""
+    transaction.on_commit(bump_catalog_version)
+
+
+def touch_products(queryset):
+    """Mark the products of `queryset` as changed by moving their last_update."""
+    return queryset.update(last_update=datetime.now(timezone.utc))
+
+
+def catalog_cache_key(request):
+    # Path and the sorted query string cover filters, search, ordering and
+    # page; the host is part of the key because pagination links are absolute.
+    # The validators come from conditional_catalog_response when it wraps the
+    # view, and are otherwise the catalog version
+    params = sorted(request.query_params.lists())
+    raw = f'{request.get_host()}{request.path}?{params}'
+    validators = getattr(request, 'catalog_validators', None) or get_catalog_version()
+    return f'store:catalog:{validators}:{md5(raw.encode()).hexdigest()}'
+
+
+def cache_catalog_response(view_func):
+    """Serve GET responses of a catalog view from the cache."""
+    @wraps(view_func)
+    def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return view_func(request, *args, **kwargs)
+        key = catalog_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = view_func(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.CATALOG_CACHE_TIMEOUT)
+        return response
+    return wrapper
+
+
+def conditional_catalog_response(products, versioned=True):
+    """
+    Answer conditional GETs of a catalog view with 304 Not Modified.
+
+    `products(request, *args, **kwargs)` returns the Product queryset the
+    response depends on. Its Max(last_update), which the last_update index
+    answers, makes up the validators, together with the catalog version
+    unless `versioned` is False (a single product's detail, which deletes and
+    collection writes do not change). A 304 never serializes anything.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_func(request, *args, **kwargs)
+            try:
+                last_update = products(request, *args, **kwargs).aggregate(last_update=Max('last_update'))['last_update']
+            except (ValueError, TypeError):
+                # e.g. a non-numeric pk: the view answers it (with a 404)
+                return view_func(request, *args, **kwargs)
+            if versioned:
+                version = get_catalog_version()
+                last_modified = datetime.fromtimestamp(version / 1000, tz=timezone.utc)
+                if last_update is not None:
+                    last_modified = max(last_modified, last_update)
+            elif last_update is None:
+                # Nothing to validate, e.g. an unknown product
+                return view_func(request, *args, **kwargs)
+            else:
+                version = None
+                last_modified = last_update
+            validators = md5(f'{version}:{last_update}'.encode()).hexdigest()
+            etag = f'W/"{validators}"'
+            last_modified = int(last_modified.timestamp())
+            request.catalog_validators = validators
+
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view_func(request, *args, **kwargs)
+            if response.status_code in (status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+                response['ETag'] = etag
+                response['Last-Modified'] = http_date(last_modified)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,44 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Cart, CartItem
+
+# Carts are anonymous and only leave the database at checkout, so abandoned
+# ones are expired: every cart item write moves Cart.last_activity forward,
+# and reap_carts deletes the carts idle for longer than CART_TTL seconds.
+
+
+def touch_cart(cart_id):
+    """Record activity on cart `cart_id`; returns False if there is no such cart."""
+    return bool(Cart.objects.filter(pk=cart_id).update(last_activity=timezone.now()))
+
+
+def reap_carts(batch_size=1000, limit=None):
+    """
+    Delete carts idle for longer than CART_TTL, with their items.
+
+    Carts are deleted `batch_size` at a time, oldest first, each batch in its
+    own transaction so no lock is held for long; at most `limit` carts are
+    deleted when it is given. Returns {'carts': n, 'items': n}.
+    """
+    cutoff = timezone.now() - timedelta(seconds=settings.CART_TTL)
+    reclaimed = {'carts': 0, 'items': 0}
+    while limit is None or reclaimed['carts'] < limit:
+        size = batch_size if limit is None else min(batch_size, limit - reclaimed['carts'])
+        ids = list(
+            Cart.objects
+            .filter(last_activity__lt=cutoff)
+            .order_by('last_activity')
+            .values_list('pk', flat=True)[:size]
+        )
+        if not ids:
+            break
+        with transaction.atomic():
+            # A cart written to since it was selected is spared
+            deleted, per_model = Cart.objects.filter(pk__in=ids, last_activity__lt=cutoff).delete()
+        reclaimed['carts'] += per_model.get(Cart._meta.label, 0)
+        reclaimed['items'] += per_model.get(CartItem._meta.label, 0)
+        if len(ids) < size:
+            break
+    return reclaimed
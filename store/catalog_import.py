@@ -0,0 +1,293 @@
+import csv
+import json
+from itertools import islice
+from django.db import connection, transaction
+from django.utils import timezone
+from rest_framework import serializers
+from .cache import invalidate_catalog, touch_products
+from .counters import rebuild_collection_counts
+from .models import Collection, Product, Promotion
+
+# Bulk catalog import. Records are read one line at a time from a CSV (with
+# a header row) or NDJSON stream and processed in batches: each batch is
+# validated field by field, its collections and promotions are resolved with
+# one query per model, and it is written with bulk_create/bulk_update in a
+# single short transaction. Invalid records, including lines that are not
+# UTF-8 and CSV rows with more cells than the header, are reported and
+# skipped; they never stop the import.
+#
+#   collections  title                  matched on title, missing ones created
+#   promotions   description, discount  upserted on description
+#   products     title, slug, description, unit_price, inventory,
+#                collection (title), promotions (descriptions, "a|b" in CSV)
+#                upserted on slug; a promotions column replaces the product's
+#                promotions, no column leaves them alone
+
+FORMATS = ('csv', 'ndjson')
+
+# Streams are opened with errors='surrogateescape': a line that is not UTF-8
+# then still reads, and is rejected on its own instead of ending the import
+ENCODING_ERRORS = 'surrogateescape'
+
+
+class UnreadableRecord:
+    """A line read_records could not turn into a record."""
+    def __init__(self, message):
+        self.message = message
+
+
+def decodes(text):
+    try:
+        text.encode('utf-8')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+def read_records(stream, format):
+    """Yield (line number, record or UnreadableRecord) pairs from a text stream."""
+    if format == 'csv':
+        reader = csv.DictReader(stream)
+        for record in reader:
+            if None in record:
+                # More cells than the header has columns
+                columns = len(reader.fieldnames)
+                record = UnreadableRecord(f'Expected {columns} cells, got {columns + len(record[None])}')
+            elif not all(decodes(value) for value in record.values() if value is not None):
+                record = UnreadableRecord('Not valid UTF-8')
+            yield reader.line_num, record
+    elif format == 'ndjson':
+        for line, text in enumerate(stream, start=1):
+            if not text.strip():
+                continue
+            if not decodes(text):
+                yield line, UnreadableRecord('Not valid UTF-8')
+                continue
+            try:
+                yield line, json.loads(text)
+            except ValueError:
+                yield line, None
+    else:
+        raise ValueError(f'Unknown import format {format}')
+
+
+class DelimitedListField (serializers.ListField):
+    # CSV cells carry lists as "a|b"
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            data = [item.strip() for item in data.split('|') if item.strip()]
+        return super().to_internal_value(data)
+
+
+class CollectionRecordSerializer (serializers.Serializer):
+    title = serializers.CharField(max_length=255)
+
+
+class PromotionRecordSerializer (serializers.Serializer):
+    description = serializers.CharField(max_length=255)
+    discount = serializers.FloatField(min_value=0, max_value=1)
+
+
+class ProductRecordSerializer (serializers.Serializer):
+    # Plain fields only: nothing here may query the database per record
+    title = serializers.CharField(max_length=255)
+    slug = serializers.SlugField(max_length=50)
+    description = serializers.CharField(allow_blank=True, default='')
+    unit_price = serializers.DecimalField(max_digits=6, decimal_places=2, min_value=0)
+    inventory = serializers.IntegerField(min_value=0)
+    collection = serializers.CharField(max_length=255)
+    promotions = DelimitedListField(child=serializers.CharField(max_length=255), required=False)
+
+
+class CatalogImport:
+    """
+    Import `kind` records in batches of `batch_size`.
+
+    `report(line, errors)` is called for every rejected record. With
+    dry_run, everything is validated and counted but nothing is written.
+    """
+    serializers = {
+        'collections': CollectionRecordSerializer,
+        'promotions': PromotionRecordSerializer,
+        'products': ProductRecordSerializer,
+    }
+
+    def __init__(self, kind, batch_size=1000, dry_run=False, report=None):
+        if kind not in self.serializers:
+            raise ValueError(f'Unknown import kind {kind}')
+        self.kind = kind
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.report = report
+        self.created = self.updated = self.failed = 0
+        # title -> id and description -> id, filled one query per batch
+        self.collection_ids = {}
+        self.promotion_ids = {}
+        self.touched_collections = set()
+
+    def run(self, records):
+        records = iter(records)
+        while True:
+            batch = list(islice(records, self.batch_size))
+            if not batch:
+                break
+            rows = self.validate(batch)
+            with transaction.atomic():
+                getattr(self, f'import_{self.kind}')(rows)
+                # Promotions only move the last_update of promoted products
+                if not self.dry_run and self.kind != 'promotions':
+                    invalidate_catalog()
+        if self.touched_collections and not self.dry_run:
+            # bulk writes send no signals to keep products_count in step
+            rebuild_collection_counts(self.batch_size, pks=self.touched_collections)
+        return self
+
+    def reject(self, line, errors):
+        self.failed += 1
+        if self.report is not None:
+            self.report(line, errors)
+
+    def validate(self, batch):
+        serializer_class = self.serializers[self.kind]
+        rows = []
+        for line, record in batch:
+            if isinstance(record, UnreadableRecord):
+                self.reject(line, {'non_field_errors': [record.message]})
+                continue
+            if not isinstance(record, dict):
+                self.reject(line, {'non_field_errors': ['Not a JSON object']})
+                continue
+            serializer = serializer_class(data=record)
+            if serializer.is_valid():
+                rows.append((line, serializer.validated_data))
+            else:
+                self.reject(line, serializer.errors)
+        return rows
+
+    def lookup(self, model, field, values, ids):
+        missing = [value for value in values if value not in ids]
+        if missing:
+            # The oldest row wins when a title/description is not unique
+            rows = model.objects \
+                .filter(**{f'{field}__in': missing}) \
+                .order_by('-pk') \
+                .values_list(field, 'pk')
+            ids.update(rows)
+        return ids
+
+    def fill_ids(self, model, field, objects):
+        # e.g. MySQL: the inserted ids have to be read back in one query
+        if objects and objects[0].pk is None:
+            ids = dict(
+                model.objects
+                .filter(**{f'{field}__in': [getattr(obj, field) for obj in objects]})
+                .order_by('pk')
+                .values_list(field, 'pk')
+            )
+            for obj in objects:
+                obj.pk = ids[getattr(obj, field)]
+
+    def import_collections(self, rows):
+        titles = list(dict.fromkeys(data['title'] for line, data in rows))
+        self.lookup(Collection, 'title', titles, self.collection_ids)
+        new = [Collection(title=title) for title in titles if title not in self.collection_ids]
+        self.created += len(new)
+        if self.dry_run:
+            self.collection_ids.update((collection.title, None) for collection in new)
+            return
+        Collection.objects.bulk_create(new)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            self.fill_ids(Collection, 'title', new)
+        self.collection_ids.update((collection.title, collection.pk) for collection in new)
+
+    def import_promotions(self, rows):
+        # A description repeated in the batch: the last record wins
+        records = {data['description']: data for line, data in rows}
+        self.lookup(Promotion, 'description', records, self.promotion_ids)
+        promotions = [
+            Promotion(pk=self.promotion_ids.get(description), description=description, discount=data['discount'])
+            for description, data in records.items()
+        ]
+        new = [promotion for promotion in promotions if promotion.pk is None]
+        existing = [promotion for promotion in promotions if promotion.pk is not None]
+        self.created += len(new)
+        self.updated += len(existing)
+        if self.dry_run:
+            return
+        Promotion.objects.bulk_create(new)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            self.fill_ids(Promotion, 'description', new)
+        Promotion.objects.bulk_update(existing, ['discount'])
+        # The new discounts change the prices the promoted products show
+        if existing:
+            touch_products(Product.objects.filter(promotions__in=[promotion.pk for promotion in existing]))
+        self.promotion_ids.update((promotion.description, promotion.pk) for promotion in new)
+
+    def import_products(self, rows):
+        self.lookup(Collection, 'title', {data['collection'] for line, data in rows}, self.collection_ids)
+        self.lookup(Promotion, 'description', {
+            description for line, data in rows for description in data.get('promotions', [])
+        }, self.promotion_ids)
+
+        # A slug repeated in the batch: the last record wins
+        records = {}
+        for line, data in rows:
+            errors = {}
+            if data['collection'] not in self.collection_ids:
+                errors['collection'] = [f'No collection titled "{data["collection"]}"']
+            unknown = [description for description in data.get('promotions', []) if description not in self.promotion_ids]
+            if unknown:
+                errors['promotions'] = [f'No promotion described as "{description}"' for description in unknown]
+            if errors:
+                self.reject(line, errors)
+            else:
+                records[data['slug']] = data
+        if not records:
+            return
+
+        existing = {
+            slug: (pk, collection_id) for slug, pk, collection_id in Product.objects
+            .filter(slug__in=records)
+            .order_by('-pk')
+            .values_list('slug', 'pk', 'collection_id')
+        }
+        now = timezone.now()
+        products = [
+            Product(
+                pk=existing[slug][0] if slug in existing else None,
+                title=data['title'],
+                slug=slug,
+                description=data['description'],
+                unit_price=data['unit_price'],
+                inventory=data['inventory'],
+                collection_id=self.collection_ids[data['collection']],
+                last_update=now,
+            ) for slug, data in records.items()
+        ]
+        new = [product for product in products if product.pk is None]
+        changed = [product for product in products if product.pk is not None]
+        self.created += len(new)
+        self.updated += len(changed)
+        if self.dry_run:
+            return
+
+        Product.objects.bulk_create(new)
+        if not connection.features.can_return_rows_from_bulk_insert:
+            self.fill_ids(Product, 'slug', new)
+        Product.objects.bulk_update(
+            changed, ['title', 'description', 'unit_price', 'inventory', 'collection', 'last_update']
+        )
+        self.touched_collections.update(product.collection_id for product in products)
+        self.touched_collections.update(collection_id for pk, collection_id in existing.values())
+
+        # The through-rows of every product with a promotions column are
+        # replaced by one delete and one insert
+        Through = Product.promotions.through
+        promoted = [product for product in products if 'promotions' in records[product.slug]]
+        if promoted:
+            Through.objects.filter(product_id__in=[product.pk for product in promoted]).delete()
+            Through.objects.bulk_create([
+                Through(product_id=product.pk, promotion_id=self.promotion_ids[description])
+                for product in promoted
+                for description in dict.fromkeys(records[product.slug]['promotions'])
+            ])
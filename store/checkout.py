@@ -0,0 +1,102 @@
+from django.db import connection, transaction
+from .inventory import reserve_inventory, OutOfStockError
+from .jobs import job_handler
+from .models import Cart, CartItem, Order, OrderItem
+from .pricing import price_products
+
+
+class CheckoutError (Exception):
+    def __init__(self, detail):
+        self.detail = detail
+        super().__init__(detail)
+
+
+def fill_order(order, cart_id):
+    """
+    Move the items of cart `cart_id` into `order` and delete the cart.
+
+    The query count does not depend on the size of the cart: one cart item
+    fetch, one stock reservation, one promotion lookup, one order item insert
+    and the cart delete.
+    Raises CheckoutError for missing, empty or out-of-stock carts; the caller's
+    transaction must then be rolled back.
+    """
+    #Operation 1: GET THE CART ITEMS CORRESPONDNG TO THE CART ID 
+    cart_items = list(CartItem.objects \
+                        .select_related('product') \
+                        .filter(cart_id = cart_id))
+    if not cart_items:
+        if not Cart.objects.filter(pk = cart_id).exists():
+            raise CheckoutError({'cart_id': ['No Cart with the given ID exists']})
+        raise CheckoutError({'cart_id': ['Cart is Empty']})
+
+    #Operation 2: RESERVE THE STOCK (the whole transaction rolls back if any product is short)
+    quantities = {item.product_id: item.quantity for item in cart_items}
+    try:
+        reserve_inventory(quantities)
+    except OutOfStockError as error:
+        raise CheckoutError({
+            'cart_id': [str(error)],
+            'out_of_stock': [product.id for product in error.products]
+        })
+    #The products were fetched before the reservation; the response shows them as reserved
+    for item in cart_items:
+        item.product.inventory -= quantities[item.product_id]
+
+    #Operation 3: COPY ALL THE FETCHED CART ITEMS INTO THE ORDER ITEM TABLE AT THEIR PROMOTION PRICE
+    price_products([item.product for item in cart_items])
+    order_items = [
+        OrderItem(
+            order = order,
+            product = item.product,
+            quantity = item.quantity,
+            unit_price = item.product.effective_price
+        ) for item in cart_items
+    ]
+    OrderItem.objects.bulk_create(order_items)
+    if not connection.features.can_return_rows_from_bulk_insert:
+        # e.g. MySQL: the inserted ids have to be read back in one query
+        ids = dict(OrderItem.objects.filter(order = order).values_list('product_id', 'id'))
+        for order_item in order_items:
+            order_item.id = ids[order_item.product_id]
+
+    #Operation 4: DELETE THE CART (Since we use moodel.CASCADE, all order items attached will be deleted too)
+    #If a concurrent checkout of the same cart got here first, nothing is deleted and this one rolls back
+    (deleted, deleted_per_model) = Cart.objects.filter(pk=cart_id).delete()
+    if not deleted_per_model.get(Cart._meta.label):
+        raise CheckoutError({'cart_id': ['No Cart with the given ID exists']})
+
+    #The order items (with their products) are handed to OrderSerializer
+    #as if prefetched, so serializing the response runs no queries
+    order._prefetched_objects_cache = {'orderitem_set': order_items}
+    return order
+
+
+@job_handler('checkout')
+def finalize_checkout(order_id, cart_id):
+    # Finalizes an order queued by an async checkout: a successful checkout
+    # moves the order from Queued to Pending (payment), a failed one to Failed.
+    # claim_job re-runs jobs whose worker died, possibly after this one had
+    # committed, so only a Queued order is touched; the row lock makes a re-run
+    # wait for a run that is still in flight
+    try:
+        with transaction.atomic():
+            order = Order.objects.select_for_update().get(pk=order_id)
+            if order.payment_status != Order.PAYMENT_STATUS_QUEUED:
+                return None
+            fill_order(order, cart_id)
+            order.payment_status = Order.PAYMENT_STATUS_PENDING
+            order.save(update_fields=['payment_status'])
+    except CheckoutError as error:
+        fail_queued_order(order_id)
+        return error.detail
+    except Exception:
+        # e.g. a database error: the job fails, the order must not stay Queued
+        fail_queued_order(order_id)
+        raise
+
+
+def fail_queued_order(order_id):
+    Order.objects \
+        .filter(pk=order_id, payment_status=Order.PAYMENT_STATUS_QUEUED) \
+        .update(payment_status=Order.PAYMENT_STATUS_FAILED)
@@ -0,0 +1,50 @@
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from .cache import invalidate_catalog
+from .models import Collection, Product, Review
+
+
+def _rebuild(model, field, child_model, fk, batch_size, pks=None, **changes):
+    # Only rows whose counter is off are written; `changes` are further
+    # fields set on them
+    counts = Subquery(
+        child_model.objects
+        .filter(**{fk: OuterRef('pk')})
+        .order_by()
+        .values(fk)
+        .annotate(n=Count('pk'))
+        .values('n')
+    )
+    parents = model.objects.all() if pks is None else model.objects.filter(pk__in=pks)
+    updated = 0
+    last_pk = 0
+    # Walk the parent table in primary-key ranges so each UPDATE holds its
+    # locks only for one batch
+    while True:
+        batch = list(
+            parents.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return updated
+        with transaction.atomic():
+            updated += parents \
+                .filter(pk__gte=batch[0], pk__lte=batch[-1]) \
+                .exclude(**{field: Coalesce(counts, Value(0))}) \
+                .update(**{field: Coalesce(counts, Value(0))}, **changes)
+        last_pk = batch[-1]
+
+
+def rebuild_collection_counts(batch_size=1000, pks=None):
+    """Recompute Collection.products_count (of the `pks` collections, or all)."""
+    updated = _rebuild(Collection, 'products_count', Product, 'collection', batch_size, pks)
+    if updated:
+        invalidate_catalog()
+    return updated
+
+
+def rebuild_product_counts(batch_size=1000):
+    """Recompute Product.reviews_count from the review table."""
+    # reviews_count is part of the product payload
+    return _rebuild(Product, 'reviews_count', Review, 'product', batch_size, last_update=timezone.now())
@@ -0,0 +1,38 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .models import Customer
+
+# Maps a user to their Customer id without a query on the hot path. The id
+# is memoized on the user object for the rest of the request and kept in the
+# Django cache across requests; a user's customer id never changes, so the
+# entry only has to go when the Customer row is deleted (see store.signals).
+
+
+def customer_id_cache_key(user_id):
+    return f'store:customer-id:{user_id}'
+
+
+def cache_customer_id(user_id, customer_id):
+    # Deferred to commit so a rolled back Customer insert is never cached
+    transaction.on_commit(
+        lambda: cache.set(customer_id_cache_key(user_id), customer_id, settings.CUSTOMER_CACHE_TIMEOUT)
+    )
+
+
+def forget_customer_id(user_id):
+    cache.delete(customer_id_cache_key(user_id))
+
+
+def get_customer_id(user):
+    """Return the id of `user`'s Customer, creating the Customer if needed."""
+    customer_id = getattr(user, '_customer_id', None)
+    if customer_id is not None:
+        return customer_id
+    customer_id = cache.get(customer_id_cache_key(user.id))
+    if customer_id is None:
+        (customer, created) = Customer.objects.only('id').get_or_create(user_id = user.id)
+        customer_id = customer.id
+        cache_customer_id(user.id, customer_id)
+    user._customer_id = customer_id
+    return customer_id
@@ -0,0 +1,71 @@
+import csv
+import json
+from django.core.serializers.json import DjangoJSONEncoder
+from .models import Customer, OrderItem, Product
+
+# Streaming exports of the store tables for analytics. Rows are read in
+# primary-key ordered chunks of `chunk_size` (each chunk is one bounded
+# query that continues after the last key of the previous one) and written
+# out one line at a time, so memory use does not grow with the table.
+#
+# Keyset chunks are used instead of QuerySet.iterator() because MySQL's
+# driver buffers the whole result of a query client side; a chunk query
+# bounds that buffer on every backend.
+
+EXPORTS = {
+    'products': (Product.objects.all, [
+        'id', 'title', 'slug', 'description', 'unit_price', 'inventory', 'last_update',
+        'collection_id', 'collection__title', 'reviews_count',
+    ]),
+    # One row per order item, with the columns of its order
+    'orders': (OrderItem.objects.all, [
+        'order_id', 'order__placed_at', 'order__payment_status', 'order__customer_id',
+        'id', 'product_id', 'quantity', 'unit_price',
+    ]),
+    'customers': (Customer.objects.all, [
+        'id', 'user_id', 'user__first_name', 'user__last_name', 'user__email',
+        'phone', 'birth_date', 'membership',
+    ]),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def export_rows(name, chunk_size):
+    """Yield the rows of export `name` as tuples, `chunk_size` per query."""
+    queryset, columns = EXPORTS[name]
+    queryset = queryset().order_by('pk').values_list('pk', *columns)
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(pk__gt=last)
+        rows = list(page[:chunk_size])
+        for row in rows:
+            yield row[1:]
+        if len(rows) < chunk_size:
+            return
+        last = rows[-1][0]
+
+
+class Echo:
+    # csv.writer writes into a file; this one hands each line back instead
+    def write(self, value):
+        return value
+
+
+def export_lines(name, format, chunk_size):
+    """Yield export `name` as lines of CSV (with a header) or NDJSON."""
+    if format not in FORMATS:
+        raise ValueError(f'Unknown export format {format}')
+    columns = EXPORTS[name][1]
+    rows = export_rows(name, chunk_size)
+    if format == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
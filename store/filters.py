@@ -0,0 +1,14 @@
+from django_filters.rest_framework import FilterSet, NumberFilter
+from .models import Product
+
+
+class ProductFilter (FilterSet):
+    # effective_price is the with_effective_price annotation (store.pricing)
+    effective_price__lt = NumberFilter(field_name='effective_price', lookup_expr='lt')
+    effective_price__lte = NumberFilter(field_name='effective_price', lookup_expr='lte')
+    effective_price__gt = NumberFilter(field_name='effective_price', lookup_expr='gt')
+    effective_price__gte = NumberFilter(field_name='effective_price', lookup_expr='gte')
+
+    class Meta:
+        model = Product
+        fields = ['collection_id']
@@ -0,0 +1,35 @@
+from django.db.models import Case, When, Value, F, IntegerField
+from django.utils import timezone
+from .models import Product
+
+
+class OutOfStockError (Exception):
+    def __init__(self, products):
+        self.products = products
+        titles = ', '.join(product.title for product in products)
+        super().__init__(f'Not enough inventory for: {titles}')
+
+
+def reserve_inventory(quantities):
+    """
+    Decrement Product.inventory by `quantities` ({product_id: quantity}).
+
+    All products are decremented by one conditional UPDATE that only touches
+    rows with enough stock left, so two checkouts can never oversell the same
+    product and no row is locked longer than that statement. If any product
+    is short, OutOfStockError is raised and the caller's transaction must be
+    rolled back, which undoes the rows that were decremented.
+    """
+    if not quantities:
+        return
+    requested = Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in sorted(quantities.items())],
+        output_field=IntegerField()
+    )
+    # Moving last_update retires the catalog responses of these products only
+    updated = Product.objects \
+        .filter(pk__in=quantities, inventory__gte=requested) \
+        .update(inventory=F('inventory') - requested, last_update=timezone.now())
+    if updated != len(quantities):
+        short = Product.objects.filter(pk__in=quantities, inventory__lt=requested).only('id', 'title')
+        raise OutOfStockError(list(short))
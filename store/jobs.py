@@ -0,0 +1,94 @@
+from contextvars import ContextVar
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Job
+
+# A small database-backed job queue. Jobs are rows of store.Job; handlers
+# register themselves by kind with @job_handler and the run_jobs management
+# command is the worker that claims and runs them.
+
+JOB_HANDLERS = {}
+
+current_job = ContextVar('current_job', default=None)
+
+
+def job_handler(kind):
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+def enqueue(kind, **payload):
+    """Queue a job; it is only visible to workers once the transaction commits."""
+    return Job.objects.create(kind=kind, payload=payload)
+
+
+def claim_job():
+    """Claim the oldest runnable job, or return None when the queue is empty."""
+    # Jobs whose worker died while running them are picked up again once
+    # they have been running for longer than JOB_TIMEOUT seconds
+    stale = timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT)
+    candidates = Job.objects \
+        .filter(status=Job.STATUS_QUEUED) \
+        .order_by('id') \
+        .values_list('id', flat=True)[:10]
+    stale_candidates = Job.objects \
+        .filter(status=Job.STATUS_RUNNING, updated_at__lt=stale) \
+        .order_by('id') \
+        .values_list('id', flat=True)[:10]
+    for job_id in [*candidates, *stale_candidates]:
+        # The conditional UPDATE is the lock: of several workers racing for
+        # the same job, exactly one sees a row count of 1
+        claimed = Job.objects \
+            .filter(pk=job_id, status__in=[Job.STATUS_QUEUED, Job.STATUS_RUNNING]) \
+            .exclude(status=Job.STATUS_RUNNING, updated_at__gte=stale) \
+            .update(status=Job.STATUS_RUNNING, updated_at=timezone.now())
+        if claimed:
+            return Job.objects.get(pk=job_id)
+    return None
+
+
+def report_progress(**progress):
+    """
+    Record the progress of the running job as its result.
+
+    Long jobs should call this regularly: it also refreshes updated_at, so
+    the job is not taken for a dead worker's after JOB_TIMEOUT seconds.
+    Outside a job this does nothing.
+    """
+    job = current_job.get()
+    if job is not None:
+        Job.objects.filter(pk=job.pk).update(result=progress, updated_at=timezone.now())
+
+
+def run_job(job):
+    handler = JOB_HANDLERS.get(job.kind)
+    job.attempts += 1
+    token = current_job.set(job)
+    try:
+        if handler is None:
+            raise LookupError(f'No handler registered for {job.kind} jobs')
+        job.result = handler(**job.payload)
+        job.status = Job.STATUS_DONE
+    except Exception as error:
+        job.error = repr(error)
+        job.status = Job.STATUS_FAILED
+    finally:
+        current_job.reset(token)
+    job.save(update_fields=['attempts', 'result', 'error', 'status', 'updated_at'])
+    return job
+
+
+def run_pending_jobs(limit=None):
+    """Run queued jobs until the queue is empty or `limit` jobs have run."""
+    count = 0
+    while limit is None or count < limit:
+        job = claim_job()
+        if job is None:
+            break
+        run_job(job)
+        count += 1
+    return count
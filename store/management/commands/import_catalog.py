@@ -0,0 +1,49 @@
+import json
+import os
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from store.catalog_import import ENCODING_ERRORS, FORMATS, CatalogImport, read_records
+
+
+class Command(BaseCommand):
+    help = 'Import collections, promotions or products from a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(CatalogImport.serializers))
+        parser.add_argument('path', help='File to read, or - for stdin')
+        parser.add_argument('--format', choices=FORMATS, help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=settings.IMPORT_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Validate and count without writing')
+        parser.add_argument('--error-report', help='Write rejected records to this file as NDJSON')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        format = options['format'] or os.path.splitext(path)[1].lstrip('.')
+        if format not in FORMATS:
+            raise CommandError(f'Cannot tell the format of {path}; pass --format')
+
+        report_file = open(options['error_report'], 'w', encoding='utf-8') if options['error_report'] else None
+
+        def report(line, errors):
+            if report_file is not None:
+                report_file.write(json.dumps({'line': line, 'errors': errors}) + '\n')
+            else:
+                self.stderr.write(f'line {line}: {json.dumps(errors)}')
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8', errors=ENCODING_ERRORS)
+        try:
+            result = CatalogImport(
+                options['kind'], options['batch_size'], options['dry_run'], report
+            ).run(read_records(stream, format))
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+            if report_file is not None:
+                report_file.close()
+
+        prefix = 'Dry run: would have ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}created {result.created} and updated {result.updated} {options["kind"]}; '
+            f'{result.failed} records rejected'
+        ))
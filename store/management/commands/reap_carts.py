@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from store.carts import reap_carts
+
+
+class Command(BaseCommand):
+    help = 'Delete carts that have been idle for longer than CART_TTL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--limit', type=int, help='Delete at most this many carts')
+
+    def handle(self, *args, **options):
+        reclaimed = reap_carts(options['batch_size'], options['limit'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {reclaimed["carts"]} carts and {reclaimed["items"]} cart items'
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from store.counters import rebuild_collection_counts, rebuild_product_counts
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the denormalized products_count and reviews_count counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        collections = rebuild_collection_counts(batch_size)
+        products = rebuild_product_counts(batch_size)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt counters for {collections} collections and {products} products'
+        ))
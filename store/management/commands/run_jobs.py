@@ -0,0 +1,20 @@
+import time
+from django.core.management.base import BaseCommand
+from store.jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued store jobs (async checkouts and other background work)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+        parser.add_argument('--sleep', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+
+    def handle(self, *args, **options):
+        while True:
+            count = run_pending_jobs()
+            if count:
+                self.stdout.write(f'Ran {count} jobs')
+            if options['once']:
+                break
+            time.sleep(options['sleep'])
@@ -0,0 +1,138 @@
+import json
+import re
+import statistics
+import time
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import connection, models
+
+# Reads the SQL captured by the store benchmark suite (run it with
+# STORE_CAPTURE_SQL=<file>), EXPLAINs every SELECT against the configured
+# database and, for the ones that scan or sort a table, proposes an index
+# built from the WHERE and ORDER BY columns. Each proposal is timed before
+# and after creating the index for real; the index is dropped again so
+# adding it stays a normal Meta.indexes + makemigrations change.
+
+QUOTED_COLUMN = r'[`"](\w+)[`"]\.[`"](\w+)[`"]'
+# Markers of a full scan or an extra sort in SQLite and MySQL plans
+SCAN_MARKERS = [
+    re.compile(r'\bSCAN (?!.*\bUSING (COVERING )?INDEX\b)'),
+    re.compile(r'TEMP B-TREE'),
+    re.compile(r"'ALL'"),
+    re.compile(r'filesort'),
+]
+
+
+def explain(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}')
+        return str(cursor.fetchall())
+
+
+def needs_index(plan):
+    return any(marker.search(plan) for marker in SCAN_MARKERS)
+
+
+def time_query(sql, repeat):
+    timings = []
+    with connection.cursor() as cursor:
+        for i in range(repeat):
+            start = time.perf_counter()
+            cursor.execute(sql)
+            cursor.fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def candidate_index(sql, models_by_table):
+    """Return (model, field names) for the index `sql` would use, or None."""
+    table = re.search(r'\bFROM [`"](\w+)[`"]', sql)
+    if table is None or table.group(1) not in models_by_table:
+        return None
+    table = table.group(1)
+    model = models_by_table[table]
+    fields_by_column = {field.column: field.name for field in model._meta.concrete_fields}
+
+    where, order_by = sql, ''
+    if ' ORDER BY ' in sql:
+        where, order_by = sql.rsplit(' ORDER BY ', 1)
+    equal, ranged = [], []
+    for (column_table, column, operator) in re.findall(QUOTED_COLUMN + r'\s*(=|IN\b|<=|>=|<|>|LIKE\b)', where):
+        if column_table != table or column not in fields_by_column:
+            continue
+        target = equal if operator in ('=', 'IN') else ranged
+        if column not in equal and column not in ranged:
+            target.append(column)
+    ordered = [
+        column for (column_table, column) in re.findall(QUOTED_COLUMN, order_by)
+        if column_table == table and column in fields_by_column
+    ]
+    columns = []
+    for column in equal + ranged[:1] + ordered:
+        if column not in columns:
+            columns.append(column)
+    if not columns or columns == [model._meta.pk.column]:
+        return None
+    return model, tuple(fields_by_column[column] for column in columns[:3])
+
+
+def is_covered(model, fields):
+    # An existing index whose leading columns are the candidate's already serves it
+    columns = [model._meta.get_field(name).column for name in fields]
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, model._meta.db_table)
+    return any(
+        constraint['columns'][:len(columns)] == columns
+        for constraint in constraints.values()
+        if constraint['index'] or constraint['primary_key'] or constraint['unique']
+    )
+
+
+class Command(BaseCommand):
+    help = 'Propose Meta.indexes for the captured store queries that scan or sort'
+
+    def add_arguments(self, parser):
+        parser.add_argument('capture', help='JSON lines file written by the benchmark suite (STORE_CAPTURE_SQL)')
+        parser.add_argument('--repeat', type=int, default=10, help='Runs per query when timing')
+
+    def handle(self, *args, **options):
+        models_by_table = {model._meta.db_table: model for model in apps.get_models()}
+        statements = {}
+        with open(options['capture']) as capture:
+            for line in capture:
+                entry = json.loads(line)
+                if entry['sql'].lstrip().upper().startswith('SELECT'):
+                    statements.setdefault(entry['sql'], entry.get('endpoint', ''))
+
+        proposals = {}
+        for sql, endpoint in statements.items():
+            if not needs_index(explain(sql)):
+                continue
+            candidate = candidate_index(sql, models_by_table)
+            if candidate is None or is_covered(*candidate):
+                continue
+            proposals.setdefault(candidate, []).append((endpoint, sql))
+
+        if not proposals:
+            self.stdout.write(self.style.SUCCESS('No index proposals: every captured query uses an index'))
+            return
+
+        for (model, fields), queries in proposals.items():
+            index = models.Index(fields=list(fields))
+            index.set_name_with_model(model)
+            before = sum(time_query(sql, options['repeat']) for endpoint, sql in queries)
+            with connection.schema_editor() as schema_editor:
+                schema_editor.add_index(model, index)
+            try:
+                after = sum(time_query(sql, options['repeat']) for endpoint, sql in queries)
+            finally:
+                with connection.schema_editor() as schema_editor:
+                    schema_editor.remove_index(model, index)
+
+            endpoints = sorted({endpoint for endpoint, sql in queries if endpoint})
+            self.stdout.write(f'{model._meta.label}: models.Index(fields={list(fields)})')
+            self.stdout.write(
+                f'    {len(queries)} queries ({", ".join(endpoints) or "unnamed"}): '
+                f'{before:.2f} ms before, {after:.2f} ms after'
+            )
+        self.stdout.write('Add the proposals to the models\' Meta.indexes and run makemigrations.')
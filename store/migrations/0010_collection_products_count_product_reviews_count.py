@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:38
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Collection = apps.get_model('store', 'Collection')
+    Product = apps.get_model('store', 'Product')
+    Review = apps.get_model('store', 'Review')
+
+    def count_of(model, fk):
+        return Coalesce(Subquery(
+            model.objects.filter(**{fk: OuterRef('pk')}).order_by().values(fk)
+            .annotate(n=Count('pk')).values('n')
+        ), Value(0))
+
+    Collection.objects.update(products_count=count_of(Product, 'collection'))
+    Product.objects.update(reviews_count=count_of(Review, 'product'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0009_alter_customer_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='collection',
+            name='products_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reviews_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
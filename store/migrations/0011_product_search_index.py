@@ -0,0 +1,53 @@
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute(
+            'ALTER TABLE store_product ADD FULLTEXT INDEX store_product_fulltext (title, description)'
+        )
+    elif vendor == 'sqlite':
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE store_product_fts USING fts5("
+            "title, description, content='store_product', content_rowid='id')"
+        )
+        schema_editor.execute(
+            'CREATE TRIGGER store_product_fts_insert AFTER INSERT ON store_product BEGIN '
+            'INSERT INTO store_product_fts (rowid, title, description) '
+            'VALUES (new.id, new.title, new.description); END'
+        )
+        schema_editor.execute(
+            'CREATE TRIGGER store_product_fts_delete AFTER DELETE ON store_product BEGIN '
+            "INSERT INTO store_product_fts (store_product_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); END"
+        )
+        schema_editor.execute(
+            'CREATE TRIGGER store_product_fts_update AFTER UPDATE OF title, description ON store_product BEGIN '
+            "INSERT INTO store_product_fts (store_product_fts, rowid, title, description) "
+            "VALUES ('delete', old.id, old.title, old.description); "
+            'INSERT INTO store_product_fts (rowid, title, description) '
+            'VALUES (new.id, new.title, new.description); END'
+        )
+        schema_editor.execute("INSERT INTO store_product_fts (store_product_fts) VALUES ('rebuild')")
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'mysql':
+        schema_editor.execute('ALTER TABLE store_product DROP INDEX store_product_fulltext')
+    elif vendor == 'sqlite':
+        for trigger in ['insert', 'delete', 'update']:
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS store_product_fts_{trigger}')
+        schema_editor.execute('DROP TABLE IF EXISTS store_product_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0010_collection_products_count_product_reviews_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:00
+
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def populate_last_activity(apps, schema_editor):
+    # Existing carts count as idle since they were created
+    Cart = apps.get_model('store', 'Cart')
+    Cart.objects.update(last_activity=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0013_query_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='last_activity',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.RunPython(populate_last_activity, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['last_activity'], name='store_cart_last_ac_b4a9c8_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:24
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('store', '0014_cart_last_activity'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='review',
+            name='store_revie_product_a44095_idx',
+        ),
+    ]
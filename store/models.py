@@ -2,6 +2,10 @@ from django.db import models
 from uuid import uuid4
 from django.conf import settings
 from django.contrib import admin
+from django.utils import timezone
+from django.contrib.contenttypes.fields import GenericRelation
+from likes.models import LikedItem
+from tags.models import TaggedItem
 
 # Create your models here.
 
@@ -12,6 +16,8 @@ class Promotion (models.Model):
 class Collection (models.Model):
     title = models.CharField(max_length=255)
     featured_product = models.ForeignKey('Product', on_delete=models.SET_NULL, null=True, related_name='+')
+    # Maintained by store.signals and rebuilt by the rebuild_counters command
+    products_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self) -> str:
         return self.title
@@ -28,10 +34,25 @@ class Product(models.Model):
     last_update= models.DateTimeField(auto_now=True)
     collection = models.ForeignKey(Collection, on_delete=models.PROTECT)
     promotions = models.ManyToManyField(Promotion)
+    # Maintained by store.signals and rebuilt by the rebuild_counters command
+    reviews_count = models.PositiveIntegerField(default=0, editable=False)
+    tags = GenericRelation(TaggedItem, related_query_name='product')
+    likes = GenericRelation(LikedItem, related_query_name='product')
 
     def __str__(self) -> str:
         return self.title
 
+    class Meta:
+        indexes = [
+            # ProductViewSet: ?collection_id= with ?ordering=unit_price
+            models.Index(fields=['collection', 'unit_price']),
+            # ?ordering=last_update and the Max(last_update) catalog validators
+            models.Index(fields=['last_update']),
+            # The admin's InventoryFilter (inventory < 10): low stock is a
+            # small slice of the catalog, so the range scan stays selective
+            models.Index(fields=['inventory']),
+        ]
+
 class Customer(models.Model):
     MEMBERSHIP_CHOICES = [
         ('B', 'Bronze'),
@@ -70,10 +91,15 @@ class OrderItem (models.Model):
     unit_price = models.DecimalField(max_digits=6, decimal_places=2)
 
 class Order(models.Model):
+    PAYMENT_STATUS_QUEUED = 'Q'
+    PAYMENT_STATUS_PENDING = 'P'
+    PAYMENT_STATUS_COMPLETE = 'C'
+    PAYMENT_STATUS_FAILED = 'F'
     PAYMENT_STATUS = [
-        ('P', 'Pending'),
-        ('C', 'Completed'),
-        ('F', 'Failed')
+        (PAYMENT_STATUS_QUEUED, 'Queued'),
+        (PAYMENT_STATUS_PENDING, 'Pending'),
+        (PAYMENT_STATUS_COMPLETE, 'Completed'),
+        (PAYMENT_STATUS_FAILED, 'Failed')
     ]
     placed_at = models.DateTimeField(auto_now_add=True)
     payment_status = models.CharField(max_length=2, choices=PAYMENT_STATUS, default='P')
@@ -83,6 +109,12 @@ class Order(models.Model):
         permissions = [
             ('cancel_order', 'Can cancel order')
         ]
+        indexes = [
+            # A customer's orders, paged by placed_at (OrderCursorPagination)
+            models.Index(fields=['customer', 'placed_at']),
+            # Staff see every order, paged by placed_at
+            models.Index(fields=['placed_at']),
+        ]
 
 
 class Address (models.Model):
@@ -95,6 +127,15 @@ class Address (models.Model):
 class Cart(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid4)
     created_at = models.DateTimeField(auto_now_add=True)
+    # Moved forward by every cart item write; carts idle for longer than
+    # CART_TTL are deleted by the reap_carts command
+    last_activity = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # reap_carts: last_activity < cutoff
+            models.Index(fields=['last_activity']),
+        ]
 
 class CartItem (models.Model):
     cart = models.ForeignKey(Cart, on_delete=models.CASCADE)
@@ -109,10 +150,27 @@ class Review (models.Model):
     name = models.CharField(max_length=255)
     description = models.TextField()
     date = models.DateField(auto_now_add=True)
-    
-
 
-    
 
-    
+class Job (models.Model):
+    STATUS_QUEUED = 'Q'
+    STATUS_RUNNING = 'R'
+    STATUS_DONE = 'D'
+    STATUS_FAILED = 'F'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_DONE, 'Done'),
+        (STATUS_FAILED, 'Failed')
+    ]
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=1, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    result = models.JSONField(null=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'])]
@@ -0,0 +1,102 @@
+from decimal import Decimal, ROUND_HALF_UP
+from django.conf import settings
+from django.db.models import DecimalField, ExpressionWrapper, F, FloatField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Cast, Coalesce, Greatest, Least, Round
+from .models import Product
+
+# Prices a batch of products in one pass with exact Decimal arithmetic:
+#   discount        the best Promotion.discount of the product (a fraction, 0.1 = 10% off)
+#   effective_price unit_price with that discount applied
+#   price_with_tax  effective_price with TAX_RATE added
+# The discount comes from the best_discount annotation (with_effective_price)
+# or the prefetched `promotions` relation when present, and otherwise from one
+# grouped query for the whole batch.
+
+CENT = Decimal('0.01')
+
+
+def to_cents(amount):
+    return amount.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def tax_rate():
+    return Decimal(str(settings.TAX_RATE))
+
+
+def is_priced(product):
+    return 'price_with_tax' in product.__dict__
+
+
+def set_prices(product, discount, rate):
+    discount = min(max(Decimal(str(discount or 0)), Decimal(0)), Decimal(1))
+    product.discount = discount
+    product.effective_price = to_cents(product.unit_price * (1 - discount))
+    product.price_with_tax = to_cents(product.effective_price * (1 + rate))
+
+
+def price_products(products):
+    """Set discount, effective_price and price_with_tax on `products`."""
+    pending = {product.id: product for product in products if not is_priced(product)}
+    if not pending:
+        return
+    rate = tax_rate()
+    unprefetched = {
+        product_id for product_id, product in pending.items()
+        if 'best_discount' not in product.__dict__
+        and 'promotions' not in getattr(product, '_prefetched_objects_cache', {})
+    }
+    discounts = {}
+    if unprefetched:
+        discounts = dict(
+            Product.promotions.through.objects
+            .filter(product_id__in=unprefetched)
+            .values_list('product_id')
+            .annotate(best=Max('promotion__discount'))
+        )
+    for product_id, product in pending.items():
+        if product_id in unprefetched:
+            discount = discounts.get(product_id)
+        elif 'best_discount' in product.__dict__:
+            discount = product.best_discount
+        else:
+            discount = max((promotion.discount for promotion in product.promotions.all()), default=None)
+        set_prices(product, discount, rate)
+    # Products repeated in `products` (e.g. in several carts) share the prices
+    for product in products:
+        if not is_priced(product):
+            set_prices(product, pending[product.id].discount, rate)
+
+
+def with_effective_price(queryset):
+    """
+    Annotate products with best_discount and effective_price in SQL.
+
+    The annotation makes effective_price usable for ordering and range
+    filters in the database. The best discount is a correlated subquery that
+    the unique (product_id, promotion_id) index of the promotions table
+    answers, so it does not group the product list. Serializers still show
+    the exact Decimal prices from price_products, which reads best_discount
+    instead of querying the promotions again.
+    """
+    best_discount = Subquery(
+        Product.promotions.through.objects
+        .filter(product_id=OuterRef('pk'))
+        .order_by()
+        .values('product_id')
+        .annotate(best=Max('promotion__discount'))
+        .values('best'),
+        output_field=FloatField()
+    )
+    # Computed in decimal and rounded to cents like to_cents, so filters and
+    # ordering see exactly the price the serializers show
+    discount = Cast(F('best_discount'), DecimalField(max_digits=7, decimal_places=6))
+    price = ExpressionWrapper(
+        F('unit_price') * (Value(Decimal(1)) - discount),
+        output_field=DecimalField(max_digits=14, decimal_places=8)
+    )
+    return queryset.annotate(
+        # Clamped to [0, 1] like set_prices
+        best_discount=Greatest(Least(Coalesce(best_discount, Value(0.0)), Value(1.0)), Value(0.0))
+    ).annotate(
+        effective_price=Round(price, 2, output_field=DecimalField(max_digits=8, decimal_places=2))
+    )
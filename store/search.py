@@ -0,0 +1,53 @@
+from django.db import connections
+from django.db.models.expressions import RawSQL
+from rest_framework.filters import SearchFilter
+
+# Product full-text search. MySQL uses the FULLTEXT index on
+# store_product(title, description); SQLite uses the store_product_fts FTS5
+# table, which triggers keep in step with store_product. Both are created by
+# migration 0011_product_search_index. Other databases fall back to the
+# icontains scan of DRF's SearchFilter.
+
+def fts5_query(term):
+    # Quote every word so user input is never parsed as FTS5 query syntax;
+    # the quoted words are ANDed together
+    words = term.split()
+    return ' '.join('"{}"'.format(word.replace('"', '""')) for word in words)
+
+
+def search_products(queryset, term):
+    """Filter `queryset` to the products matching `term`, best match first."""
+    connection = connections[queryset.db]
+    if connection.vendor == 'mysql':
+        rank = RawSQL(
+            'MATCH (store_product.title, store_product.description) AGAINST (%s IN NATURAL LANGUAGE MODE)',
+            [term]
+        )
+        return queryset.annotate(search_rank=rank).filter(search_rank__gt=0).order_by('-search_rank')
+
+    if connection.vendor == 'sqlite':
+        query = fts5_query(term)
+        if not query:
+            return queryset
+        # The match runs inside the product query, so every other filter,
+        # the count and the pagination see all of its matches; the rank is
+        # looked up by rowid for the rows that are left
+        matches = RawSQL('SELECT rowid FROM store_product_fts WHERE store_product_fts MATCH %s', [query])
+        rank = RawSQL(
+            'SELECT rank FROM store_product_fts WHERE store_product_fts MATCH %s AND rowid = store_product.id',
+            [query]
+        )
+        return queryset.filter(pk__in=matches).annotate(search_rank=rank).order_by('search_rank')
+
+    return None
+
+
+class ProductSearchFilter (SearchFilter):
+    def filter_queryset(self, request, queryset, view):
+        term = ' '.join(self.get_search_terms(request))
+        if not term:
+            return queryset
+        results = search_products(queryset, term)
+        if results is None:
+            return super().filter_queryset(request, queryset, view)
+        return results
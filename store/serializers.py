@@ -1,8 +1,11 @@
-import decimal
 from rest_framework import serializers
 from store.models import Product, CartItem, Collection, Review, Cart, Customer, Order, OrderItem
-from decimal import Decimal
-from django.db import transaction
+from django.db import IntegrityError, connection, models, transaction
+from django.db.models import F
+from store.checkout import fill_order, CheckoutError
+from store.customers import get_customer_id
+from store.jobs import enqueue
+from store.pricing import price_products
 
 # class CollectionSerializer (serializers.Serializer):
     
@@ -24,20 +27,29 @@ class CollectionSerializer (serializers.ModelSerializer):
         model = Collection
         fields = ['id', 'title', 'products_count']
 
-    products_count = serializers.SerializerMethodField(method_name='get_products_count')
-    # n_products = serializers.IntegerField()
+    # Denormalized counter kept up to date by store.signals
+    products_count = serializers.IntegerField(read_only=True)
 
-    def get_products_count (self, collection):
-        return collection.product_set.count()
 
 
+class PricedListSerializer (serializers.ListSerializer):
+    # Prices the products of the whole list in one batch (store.pricing)
+    # before any item is serialized
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        price_products(self.child.products_to_price(items))
+        return super().to_representation(items)
+
 
 class ProductSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
-        fields = ['id', 'title', 'unit_price', 'slug', 'description', 'inventory', 'collection', 'price_with_tax']
+        fields = ['id', 'title', 'unit_price', 'slug', 'description', 'inventory', 'collection', 'effective_price', 'price_with_tax', 'reviews_count']
+        read_only_fields = ['reviews_count']
+        list_serializer_class = PricedListSerializer
         #fields = '__all__'
 
+    effective_price = serializers.SerializerMethodField(method_name='get_effective_price')
     price_with_tax = serializers.SerializerMethodField(method_name='calculate_tax')
     # collection = CollectionSerializer()
     
@@ -47,19 +59,55 @@ class ProductSerializer(serializers.ModelSerializer):
     # collection = serializers.PrimaryKeyRelatedField(queryset= Collection.objects.all())
     # collection = serializers.StringRelatedField()
 
+    def products_to_price(self, products):
+        return products
+
+    def to_representation(self, product):
+        price_products([product])
+        return super().to_representation(product)
+
+    def get_effective_price( self, product:Product):
+        return product.effective_price
 
     def calculate_tax( self, product:Product):
-        return product.unit_price * Decimal(1.1)
+        return product.price_with_tax
+
+
+class CatalogProductSerializer(ProductSerializer):
+    class Meta(ProductSerializer.Meta):
+        fields = ProductSerializer.Meta.fields + ['tags', 'likes_count']
+
+    # Read from with_tags_and_likes, otherwise one query each per product
+    tags = serializers.SerializerMethodField(method_name='get_tags')
+    likes_count = serializers.SerializerMethodField(method_name='get_likes_count')
+
+    def get_tags( self, product:Product):
+        return [item.tag.label for item in product.tags.all()]
+
+    def get_likes_count( self, product:Product):
+        if hasattr(product, 'likes_count'):
+            return product.likes_count
+        return product.likes.count()
 
 
 class CartItemSerializer (serializers.ModelSerializer):
     class Meta:
         model = CartItem    
         fields = ['id', 'product', 'quantity', 'total_price'] 
+        list_serializer_class = PricedListSerializer
     product = ProductSerializer()  
     total_price = serializers.SerializerMethodField(method_name = 'get_total_price')
+
+    def products_to_price(self, cart_items):
+        return [cart_item.product for cart_item in cart_items]
+
     def get_total_price (self, cart_item:CartItem):
-        return  cart_item.quantity * cart_item.product.unit_price  
+        price_products([cart_item.product])
+        return  cart_item.quantity * cart_item.product.effective_price  
+
+# Largest quantity CartItem.quantity (a PositiveSmallIntegerField) can hold
+MAX_CART_QUANTITY = 32767
+
 
 class AddCartItemSerializer(serializers.ModelSerializer):
     product_id = serializers.IntegerField() 
@@ -78,19 +126,102 @@ class AddCartItemSerializer(serializers.ModelSerializer):
         cart_id = self.context['cart_id']
         
         # print(product_id)
-    
-        try:
-            
-            existing_cart_item = CartItem.objects.get(cart_id= cart_id, product_id= product_id)
-            existing_cart_item.quantity += quantity
-            existing_cart_item.save()
-            self.instance = existing_cart_item
-            
-        except CartItem.DoesNotExist:
-            self.instance = CartItem.objects.create(cart_id=cart_id, **self.validated_data) 
-        
+
+        # The increment happens inside the UPDATE statement, so concurrent adds
+        # to the same line cannot overwrite each other. When the line does not
+        # exist yet it is inserted; if a concurrent request inserted it first,
+        # the unique (cart, product) constraint rejects our insert and we fall
+        # back to incrementing the row that won.
+        items = CartItem.objects.filter(cart_id=cart_id, product_id=product_id)
+        if not items.update(quantity=F('quantity') + quantity):
+            try:
+                with transaction.atomic():
+                    self.instance = CartItem.objects.create(cart_id=cart_id, **self.validated_data)
+                return self.instance
+            except IntegrityError:
+                items.update(quantity=F('quantity') + quantity)
+        self.instance = items.get()
         return self.instance
     
+class CartItemOperationSerializer (serializers.Serializer):
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, max_value=MAX_CART_QUANTITY)
+
+
+class BulkCartItemSerializer (serializers.Serializer):
+    MODE_CHOICES = [
+        ('add', 'Add to the existing quantity'),
+        ('set', 'Replace the existing quantity')
+    ]
+    items = CartItemOperationSerializer(many=True, allow_empty=False)
+    mode = serializers.ChoiceField(choices=MODE_CHOICES, default='add')
+
+    def validate_items(self, items):
+        # All product ids are checked with a single query
+        product_ids = {item['product_id'] for item in items}
+        existing = set(Product.objects.filter(pk__in=product_ids).values_list('pk', flat=True))
+        missing = sorted(product_ids - existing)
+        if missing:
+            raise serializers.ValidationError(f'No product with the Ids {missing} exist!!!')
+        return items
+
+    def validate(self, data):
+        # Repeated product ids are merged before touching the database
+        quantities = {}
+        for item in data['items']:
+            if data['mode'] == 'add':
+                quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+            else:
+                quantities[item['product_id']] = item['quantity']
+        too_many = sorted(product_id for product_id, quantity in quantities.items() if quantity > MAX_CART_QUANTITY)
+        if too_many:
+            raise serializers.ValidationError({'items': [f'More than {MAX_CART_QUANTITY} of the products {too_many}']})
+        data['quantities'] = quantities
+        return data
+
+    def save(self, **kwargs):
+        cart_id = self.context['cart_id']
+        quantities = self.validated_data['quantities']
+        if self.validated_data['mode'] == 'set':
+            # One upsert on the unique (cart, product) constraint: lines that
+            # exist, or that a concurrent request has just inserted, are updated
+            conflict_target = {}
+            if connection.features.supports_update_conflicts_with_target:
+                conflict_target['unique_fields'] = ['cart', 'product']
+            CartItem.objects.bulk_create(
+                [CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+                 for product_id, quantity in quantities.items()],
+                update_conflicts=True, update_fields=['quantity'], **conflict_target
+            )
+            return
+        try:
+            with transaction.atomic():
+                self.add(cart_id, quantities)
+        except IntegrityError:
+            # A concurrent request inserted one of our new lines first; the
+            # row exists now, so a second pass locks and increments it
+            with transaction.atomic():
+                self.add(cart_id, quantities)
+
+    def add(self, cart_id, quantities):
+        quantities = dict(quantities)
+        existing = list(
+            CartItem.objects.select_for_update()
+            .filter(cart_id=cart_id, product_id__in=quantities)
+        )
+        for cart_item in existing:
+            cart_item.quantity += quantities.pop(cart_item.product_id)
+        # Checked under the row locks, so concurrent adds cannot overshoot
+        too_many = sorted(item.product_id for item in existing if item.quantity > MAX_CART_QUANTITY)
+        if too_many:
+            raise serializers.ValidationError({'items': [f'More than {MAX_CART_QUANTITY} of the products {too_many}']})
+        CartItem.objects.bulk_update(existing, ['quantity'])
+        CartItem.objects.bulk_create(
+            CartItem(cart_id=cart_id, product_id=product_id, quantity=quantity)
+            for product_id, quantity in quantities.items()
+        )
+
+
 class UpdateCartItemSerializer (serializers.ModelSerializer):
     class Meta:
         model = CartItemSerializer
@@ -104,7 +235,9 @@ class CartSerializer (serializers.ModelSerializer):
     total_price = serializers.SerializerMethodField()
 
     def get_total_price (self, cart:Cart):
-        return sum([item.quantity * item.product.unit_price for item in cart.cartitem_set.all() ])
+        items = cart.cartitem_set.all()
+        price_products([item.product for item in items])
+        return sum([item.quantity * item.product.effective_price for item in items ])
     class Meta:
         model = Cart
         fields = ['id', 'cartitem_set', 'total_price']
@@ -119,52 +252,67 @@ class OrderItemSerializer (serializers.ModelSerializer):
     class Meta:
         model = OrderItem
         fields = ['id', 'unit_price', 'quantity', 'product']
+        list_serializer_class = PricedListSerializer
     product = ProductSerializer()  
+
+    def products_to_price(self, order_items):
+        # Collapsed products (see get_fields) are not loaded and need no price
+        expand = self.context.get('expand')
+        if expand is not None and 'product' not in expand:
+            return []
+        return [order_item.product for order_item in order_items]
+
+    def get_fields(self):
+        # The nested product is only serialized when it is expanded (the
+        # default); otherwise just its id is returned
+        fields = super().get_fields()
+        expand = self.context.get('expand')
+        if expand is not None and 'product' not in expand:
+            fields['product'] = serializers.PrimaryKeyRelatedField(read_only=True)
+        return fields
         
 class OrderSerializer (serializers.ModelSerializer):
     orderitem_set = OrderItemSerializer(many=True)  
     class Meta:
         model = Order
         fields = ['id', 'customer', 'placed_at', 'payment_status', 'orderitem_set']
+
+    def get_fields(self):
+        # ?fields=id,placed_at limits the response to the requested fields
+        fields = super().get_fields()
+        requested = self.context.get('fields')
+        if requested is not None:
+            fields = {name: field for name, field in fields.items() if name in requested}
+        return fields
         
 class  CreateOrderSerializer (serializers.Serializer):
     cart_id = serializers.UUIDField()
     
-    def validate_cart_id (self, cart_id):
-        cart_exist = Cart.objects.filter(pk = cart_id).exists()
-        if not cart_exist:
-            raise serializers.ValidationError('No Cart with the given ID exists')
-        if CartItem.objects.filter(pk=cart_id).count() == 0:
-            raise serializers.ValidationError('Cart is Empty')
-        return cart_id
+    # Checkout runs as one planned pipeline (store.checkout.fill_order) whose
+    # query count does not depend on the size of the cart. The cart's
+    # existence and emptiness are checked from its item fetch, so validation
+    # itself costs no queries.
 
     def save (self, **kwargs):
         with transaction.atomic():
             cart_id = self.validated_data['cart_id']
-            (customerId, created) = Customer.objects.only('id').get_or_create(user_id = self.context['user_id'] )
-            
-            #Operation 1: SAVE A ORDER RECORD (IMO, I wouldn't do this shaa, I would combine the order item and order tablle together nii)
-            order = Order.objects.create(customer = customerId) #Here I can equally say .create(customer_id = customerId.id) because the customerId, in realityy, returns the customer object and not really an Id
-            
-            #Operation 2: GET THE CART ITEMS CORRESPONDNG TO THE CART ID 
-            cart_items = CartItem.objects \
-                                .select_related('product') \
-                                .filter(cart_id = cart_id)
-            
-            #Operation 3: COPY ALL THE FETCHED CART ITEMS INTO THE ORDER ITEM TABLE 
-            order_items = [
-                OrderItem(
-                    order_id = order.id,
-                    product_id = item.product.id,
-                    quantity = item.quantity,
-                    unit_price = item.product.unit_price
-                ) for item in cart_items
-            ]
-            OrderItem.objects.bulk_create(order_items)
-            
-            #Operation 4: DELETE THE CART (Since we use moodel.CASCADE, all order items attached will be deleted too)
-            Cart.objects.filter(pk=cart_id).delete()
-            
+            customer_id = get_customer_id(self.context['user'])
+            order = Order.objects.create(customer_id = customer_id)
+            try:
+                return fill_order(order, cart_id)
+            except CheckoutError as error:
+                raise serializers.ValidationError(error.detail)
+
+    def enqueue (self):
+        # Async checkout: only the order row and its job are written now; a
+        # run_jobs worker finalizes the order (see store.checkout)
+        cart_id = self.validated_data['cart_id']
+        if not Cart.objects.filter(pk = cart_id).exists():
+            raise serializers.ValidationError({'cart_id': ['No Cart with the given ID exists']})
+        with transaction.atomic():
+            customer_id = get_customer_id(self.context['user'])
+            order = Order.objects.create(customer_id = customer_id, payment_status = Order.PAYMENT_STATUS_QUEUED)
+            enqueue('checkout', order_id = order.id, cart_id = str(cart_id))
             return order
         
 class UpdateOrderSerializer(serializers.ModelSerializer):
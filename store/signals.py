@@ -0,0 +1,142 @@
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import F
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete, m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+from .cache import invalidate_catalog, touch_products
+from .customers import forget_customer_id
+from likes.models import LikedItem
+from tags.models import Tag, TaggedItem
+from .models import Collection, Customer, Product, Promotion, Review
+
+# Keeps the denormalized Collection.products_count and Product.reviews_count
+# counters in step with the rows they count. The updates run in the same
+# transaction as the save/delete that triggered them. Bulk operations that do
+# not send signals (bulk_create, queryset.update) are reconciled by the
+# rebuild_counters management command.
+
+
+def adjust_counter(model, field, pk, delta, **changes):
+    # `changes` are further fields set by the same UPDATE
+    if pk is None:
+        return
+    queryset = model.objects.filter(pk=pk)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta}, **changes)
+
+
+def remember_parent(instance, fk, update_fields):
+    # The previous parent is only needed when an existing row may have moved;
+    # update_fields may name the foreign key either way ('product' or 'product_id')
+    field = instance._meta.get_field(fk)
+    moved_fields = {field.name, field.attname}
+    if instance._state.adding or instance.pk is None or \
+            (update_fields is not None and moved_fields.isdisjoint(update_fields)):
+        instance._previous_parent_id = None
+    else:
+        instance._previous_parent_id = type(instance).objects \
+            .filter(pk=instance.pk) \
+            .values_list(field.attname, flat=True) \
+            .first()
+
+
+def count_saved(instance, created, fk, parent_model, field, **changes):
+    # Returns True when an existing row moved to another parent
+    parent_id = getattr(instance, fk)
+    if created:
+        adjust_counter(parent_model, field, parent_id, 1, **changes)
+        return False
+    previous_id = getattr(instance, '_previous_parent_id', None)
+    if previous_id is not None and previous_id != parent_id:
+        adjust_counter(parent_model, field, previous_id, -1, **changes)
+        adjust_counter(parent_model, field, parent_id, 1, **changes)
+        return True
+    return False
+
+
+@receiver(pre_save, sender=Product)
+def remember_product_collection(sender, instance, update_fields=None, **kwargs):
+    remember_parent(instance, 'collection', update_fields)
+
+
+@receiver(post_save, sender=Product)
+def count_product_saved(sender, instance, created, **kwargs):
+    if count_saved(instance, created, 'collection_id', Collection, 'products_count'):
+        # The product left a collection whose own products cannot show it
+        invalidate_catalog()
+
+
+@receiver(post_delete, sender=Product)
+def count_product_deleted(sender, instance, **kwargs):
+    adjust_counter(Collection, 'products_count', instance.collection_id, -1)
+    invalidate_catalog()
+
+
+@receiver(pre_save, sender=Review)
+def remember_review_product(sender, instance, update_fields=None, **kwargs):
+    remember_parent(instance, 'product', update_fields)
+
+
+@receiver(post_save, sender=Review)
+def count_review_saved(sender, instance, created, **kwargs):
+    # reviews_count is part of the product payload, so the same UPDATE moves
+    # the product's last_update
+    count_saved(instance, created, 'product_id', Product, 'reviews_count', last_update=timezone.now())
+
+
+@receiver(post_delete, sender=Review)
+def count_review_deleted(sender, instance, **kwargs):
+    adjust_counter(Product, 'reviews_count', instance.product_id, -1, last_update=timezone.now())
+
+
+# Product saves move last_update themselves; the writes below change what a
+# product shows without saving it, so they move it explicitly
+
+@receiver(post_save, sender=Promotion)
+def touch_promoted_products(sender, instance, created, **kwargs):
+    if not created:
+        touch_products(Product.objects.filter(promotions=instance))
+
+
+@receiver(pre_delete, sender=Promotion)
+def touch_products_losing_promotion(sender, instance, **kwargs):
+    touch_products(Product.objects.filter(promotions=instance))
+
+
+@receiver(m2m_changed, sender=Product.promotions.through)
+def touch_products_of_changed_promotions(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        products = Product.objects.filter(pk__in=pk_set) if reverse else Product.objects.filter(pk=instance.pk)
+    elif action == 'pre_clear':
+        products = Product.objects.filter(promotions=instance) if reverse else Product.objects.filter(pk=instance.pk)
+    else:
+        return
+    touch_products(products)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def touch_tagged_products(sender, instance, **kwargs):
+    touch_products(Product.objects.filter(tags__tag=instance))
+
+
+@receiver(post_save, sender=TaggedItem)
+@receiver(post_delete, sender=TaggedItem)
+@receiver(post_save, sender=LikedItem)
+@receiver(post_delete, sender=LikedItem)
+def touch_tagged_or_liked_product(sender, instance, **kwargs):
+    # Tags and like counts are part of the catalog product payload
+    if instance.content_type_id == ContentType.objects.get_for_model(Product).id:
+        touch_products(Product.objects.filter(pk=instance.object_id))
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def invalidate_catalog_cache(sender, **kwargs):
+    invalidate_catalog()
+
+
+@receiver(post_delete, sender=Customer)
+def forget_deleted_customer(sender, instance, **kwargs):
+    forget_customer_id(instance.user_id)
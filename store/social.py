@@ -0,0 +1,21 @@
+from django.db.models import Count, IntegerField, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce
+from likes.models import LikedItem
+from tags.models import TaggedItem
+
+# Tags and likes reach products through generic relations (Product.tags,
+# Product.likes). with_tags_and_likes loads both for a whole page of products:
+# the tags with their labels in one prefetch query, and the like count as a
+# correlated subquery over the (content_type, object_id) index.
+
+
+def with_tags_and_likes(queryset):
+    likes = LikedItem.objects \
+        .filter(product=OuterRef('pk')) \
+        .order_by() \
+        .values('object_id') \
+        .annotate(count=Count('*')) \
+        .values('count')
+    return queryset \
+        .prefetch_related(Prefetch('tags', queryset=TaggedItem.objects.select_related('tag'))) \
+        .annotate(likes_count=Coalesce(Subquery(likes, output_field=IntegerField()), Value(0)))
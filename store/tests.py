@@ -1,3 +1,1274 @@
-from django.test import TestCase
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+import statistics
+import tempfile
+import time
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from datetime import timedelta
+from uuid import uuid4
+
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from core.generic import resolve_content_objects
+from core.models import User
+from likes.models import LikedItem
+from tags.models import Tag, TaggedItem
+from store.counters import rebuild_collection_counts, rebuild_product_counts
+from store.carts import reap_carts
+from store.catalog_import import CatalogImport, read_records
+from store.bulk import apply_in_chunks, pk_chunks
+from store.customers import get_customer_id, customer_id_cache_key
+from store.inventory import reserve_inventory
+from store.jobs import run_job, run_pending_jobs
+from store.pagination import EstimatedCountPaginator
+from store.pricing import price_products, with_effective_price
+from store.search import search_products
+from store.serializers import BulkCartItemSerializer
+from store.models import Collection, Product, Promotion, Customer, Order, OrderItem, Cart, CartItem, Review, Job
 
 # Create your tests here.
+
+# Size of the seeded dataset. Every table is seeded proportionally to this
+# number, so it can be raised locally (STORE_BENCH_SIZE=500) to look for
+# endpoints whose cost grows with the data.
+BENCH_SIZE = int(os.environ.get('STORE_BENCH_SIZE', 20))
+BENCH_REPEAT = int(os.environ.get('STORE_BENCH_REPEAT', 5))
+# When set, the SQL of every benchmarked request is appended to this file as
+# JSON lines, the input of `manage.py suggest_indexes`
+CAPTURE_SQL = os.environ.get('STORE_CAPTURE_SQL')
+
+# Recorded SQL query budget per endpoint as (fixed, per_row): an endpoint may
+# run at most fixed + per_row * BENCH_SIZE queries. Endpoints that are free of
+# N+1 queries have per_row == 0 and must stay that way.
+QUERY_BUDGETS = {
+    'collection-list': (2, 0),
+    'collection-detail': (2, 0),
+    'product-list': (4, 0),
+    'product-search': (4, 0),
+    'product-detail': (3, 0),
+    'product-review-list': (1, 0),
+    'cart-list': (5, 0),
+    'cart-detail': (4, 0),
+    'cart-items-list': (2, 0),
+    'cart-items-create': (4, 0),
+    'cart-items-bulk': (6, 0),
+    'customer-list': (2, 0),
+    'customer-profile': (1, 0),
+    'customer-history': (1, 0),
+    'orders-list': (3, 0),
+    'orders-list-compact': (2, 0),
+    'orders-detail': (3, 0),
+    # Writes and the export/import routes
+    'collection-create': (1, 0),
+    'collection-update': (2, 0),
+    'collection-delete': (3, 0),
+    'product-create': (6, 0),
+    'product-update': (9, 0),
+    'product-delete': (11, 0),
+    'product-review-detail': (1, 0),
+    'product-review-create': (2, 0),
+    'cart-create': (3, 0),
+    'cart-delete': (6, 0),
+    'cart-items-detail': (2, 0),
+    'cart-items-update': (4, 0),
+    'cart-items-delete': (3, 0),
+    'customer-detail': (1, 0),
+    'customer-update': (2, 0),
+    'customer-delete': (4, 0),
+    'customer-profile-update': (2, 0),
+    'orders-create': (8, 0),
+    'orders-update': (4, 0),
+    'orders-delete': (4, 0),
+    'export': (1, 0),
+    'import': (9, 0),
+}
+
+
+def seed_store(size):
+    """Seed every store table with a dataset proportional to `size`."""
+    promotion = Promotion.objects.create(description='Seed promotion', discount=0.1)
+    collections = Collection.objects.bulk_create(
+        Collection(title=f'Collection {i}') for i in range(size)
+    )
+    products = Product.objects.bulk_create(
+        Product(
+            title=f'Product {i}',
+            description=f'Description of product {i}',
+            slug=f'product-{i}',
+            unit_price=Decimal('10.00') + i % 50,
+            inventory=100 + i,
+            collection=collections[i % size],
+        ) for i in range(size * 3)
+    )
+    promotion.product_set.add(*products[:size])
+    Review.objects.bulk_create(
+        Review(product=products[0], name=f'Reviewer {i}', description='Review') for i in range(size)
+    )
+    rebuild_collection_counts()
+    rebuild_product_counts()
+
+    admin_user = User.objects.create_superuser(username='admin', email='admin@example.com', password='admin')
+    customer = Customer.objects.create(user=admin_user)
+    users = User.objects.bulk_create(
+        User(username=f'user{i}', email=f'user{i}@example.com') for i in range(size)
+    )
+    Customer.objects.bulk_create(Customer(user=user) for user in users)
+
+    product_type = ContentType.objects.get_for_model(Product)
+    tags = Tag.objects.bulk_create(Tag(label=f'Tag {i}') for i in range(3))
+    TaggedItem.objects.bulk_create(
+        TaggedItem(tag=tag, content_type=product_type, object_id=product.pk)
+        for product in products for tag in tags
+    )
+    LikedItem.objects.bulk_create(
+        LikedItem(user=user, content_type=product_type, object_id=products[i].pk)
+        for i, user in enumerate(users) for _ in range(2)
+    )
+
+    orders = Order.objects.bulk_create(Order(customer=customer) for i in range(size))
+    OrderItem.objects.bulk_create(
+        OrderItem(order=order, product=products[(i + j) % len(products)], quantity=1, unit_price=Decimal('10.00'))
+        for i, order in enumerate(orders) for j in range(3)
+    )
+
+    cart = Cart.objects.create()
+    CartItem.objects.bulk_create(
+        CartItem(cart=cart, product=products[i], quantity=1) for i in range(size)
+    )
+    return {
+        'admin': admin_user,
+        'customer': customer,
+        'collection': collections[0],
+        'product': products[0],
+        'order': orders[0],
+        'cart': cart,
+        'spare_product': products[size],
+    }
+
+
+def count_queries(context):
+    # TestCase runs every test inside a transaction, which turns each atomic()
+    # block into SAVEPOINT/RELEASE statements that a request does not issue
+    # when the block is outermost, so they are not charged to the budget
+    return len([
+        query for query in context.captured_queries
+        if 'SAVEPOINT' not in query['sql']
+    ])
+
+
+class StoreQueryBudgetTest (TestCase):
+    """
+    Query-count budget and latency benchmark for every route in store/urls.py.
+
+    Each endpoint is requested BENCH_REPEAT times; the SQL query count of the
+    first request is checked against QUERY_BUDGETS and the p50/p99 latency and
+    payload size are printed as a report.
+    """
+
+    results = []
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.data = seed_store(BENCH_SIZE)
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls.results:
+            print(f'\nstore benchmark (size={BENCH_SIZE}, repeat={BENCH_REPEAT})')
+            print(f'{"endpoint":<22}{"queries":>8}{"budget":>8}{"p50 ms":>10}{"p99 ms":>10}{"bytes":>10}')
+            for name, queries, budget, p50, p99, size in cls.results:
+                print(f'{name:<22}{queries:>8}{budget:>8}{p50:>10.2f}{p99:>10.2f}{size:>10}')
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.data['admin'])
+
+    def measure(self, name, method, path, data=None, repeat=BENCH_REPEAT, format='json'):
+        # Writes that cannot be repeated (deletes, checkouts) pass repeat=1;
+        # `data` may be a callable returning a fresh payload per request
+        fixed, per_row = QUERY_BUDGETS[name]
+        budget = fixed + per_row * BENCH_SIZE
+        timings = []
+        queries = None
+        response = None
+        for i in range(repeat):
+            payload = data() if callable(data) else data
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = getattr(self.client, method)(path, payload, format=format)
+                # Streaming responses run their queries while being read
+                content = b''.join(response.streaming_content) if response.streaming else response.content
+                timings.append((time.perf_counter() - start) * 1000)
+            self.assertLess(response.status_code, 400, f'{name}: {response.status_code} {content[:200]}')
+            if queries is None:
+                queries = count_queries(context)
+                if CAPTURE_SQL:
+                    with open(CAPTURE_SQL, 'a') as capture:
+                        for query in context.captured_queries:
+                            capture.write(json.dumps({'endpoint': name, 'sql': query['sql']}) + '\n')
+        p50 = statistics.median(timings)
+        p99 = statistics.quantiles(timings, n=100)[98] if len(timings) > 1 else timings[0]
+        self.results.append((name, queries, budget, p50, p99, len(content)))
+        self.assertLessEqual(
+            queries, budget,
+            f'{name} ran {queries} queries, over its budget of {budget} ({fixed} + {per_row} per row)'
+        )
+        return response
+
+    def test_collection_list(self):
+        self.measure('collection-list', 'get', '/store/collections')
+
+    def test_collection_detail(self):
+        self.measure('collection-detail', 'get', f'/store/collections/{self.data["collection"].id}')
+
+    def test_product_list(self):
+        self.measure('product-list', 'get', '/store/products/')
+
+    def test_product_search(self):
+        response = self.measure('product-search', 'get', '/store/products/?search=product 7')
+        self.assertEqual(response.data['results'][0]['title'], 'Product 7')
+
+    def test_product_detail(self):
+        self.measure('product-detail', 'get', f'/store/products/{self.data["product"].id}/')
+
+    def test_product_review_list(self):
+        self.measure('product-review-list', 'get', f'/store/products/{self.data["product"].id}/reviews/')
+
+    def test_cart_list(self):
+        self.measure('cart-list', 'get', '/store/carts/')
+
+    def test_cart_detail(self):
+        self.measure('cart-detail', 'get', f'/store/carts/{self.data["cart"].id}/')
+
+    def test_cart_items_list(self):
+        self.measure('cart-items-list', 'get', f'/store/carts/{self.data["cart"].id}/items/')
+
+    def test_cart_items_create(self):
+        self.measure('cart-items-create', 'post', f'/store/carts/{self.data["cart"].id}/items/', {
+            'product_id': self.data['spare_product'].id, 'quantity': 1
+        })
+
+    def test_cart_items_create_increments_existing_line(self):
+        url = f'/store/carts/{self.data["cart"].id}/items/'
+        product_id = self.data['product'].id
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.post(url, {'product_id': product_id, 'quantity': 2}, format='json')
+        self.assertEqual(count_queries(context), 4)
+        self.assertEqual(response.data['quantity'], 3)
+
+    def test_cart_items_bulk(self):
+        url = f'/store/carts/{self.data["cart"].id}/items/bulk/'
+        product_id = self.data['product'].id
+        spare_id = self.data['spare_product'].id
+        response = self.measure('cart-items-bulk', 'post', url, {
+            'mode': 'set',
+            'items': [{'product_id': product_id, 'quantity': 4}, {'product_id': spare_id, 'quantity': 2}]
+        })
+        quantities = {item['product']['id']: item['quantity'] for item in response.data['cartitem_set']}
+        self.assertEqual((quantities[product_id], quantities[spare_id]), (4, 2))
+
+        response = self.client.post(url, {'items': [{'product_id': 0, 'quantity': 1}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_cart_items_bulk_rejects_quantities_over_the_column_maximum(self):
+        url = f'/store/carts/{self.data["cart"].id}/items/bulk/'
+        product_id = self.data['product'].id
+        # Merged within the request
+        response = self.client.post(url, {'items': [
+            {'product_id': product_id, 'quantity': 20000}, {'product_id': product_id, 'quantity': 20000}
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        # Added to the quantity already in the cart
+        response = self.client.post(url, {'items': [{'product_id': product_id, 'quantity': 32767}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(CartItem.objects.get(cart=self.data['cart'], product_id=product_id).quantity, 1)
+
+    def test_cart_items_bulk_retries_adds_that_lose_an_insert_race(self):
+        url = f'/store/carts/{self.data["cart"].id}/items/bulk/'
+        spare_id = self.data['spare_product'].id
+        add = BulkCartItemSerializer.add
+        calls = []
+
+        def racing_add(serializer, cart_id, quantities):
+            calls.append(cart_id)
+            if len(calls) == 1:
+                # Another request inserted the line after we looked for it
+                raise IntegrityError('UNIQUE constraint failed')
+            return add(serializer, cart_id, quantities)
+
+        with mock.patch.object(BulkCartItemSerializer, 'add', racing_add):
+            response = self.client.post(url, {'items': [{'product_id': spare_id, 'quantity': 2}]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(CartItem.objects.get(cart=self.data['cart'], product_id=spare_id).quantity, 2)
+
+    def test_customer_list(self):
+        self.measure('customer-list', 'get', '/store/customers/')
+
+    def test_customer_profile(self):
+        self.measure('customer-profile', 'get', '/store/customers/profile/')
+
+    def test_customer_history(self):
+        self.measure('customer-history', 'get', f'/store/customers/{self.data["customer"].id}/history/')
+
+    def test_orders_list(self):
+        self.measure('orders-list', 'get', '/store/orders/')
+
+    def test_orders_list_without_products(self):
+        response = self.measure('orders-list-compact', 'get', '/store/orders/?fields=id,orderitem_set&expand=')
+        order = response.data['results'][0]
+        self.assertEqual(set(order), {'id', 'orderitem_set'})
+        self.assertIsInstance(order['orderitem_set'][0]['product'], int)
+
+    def test_orders_cursor_pages(self):
+        response = self.client.get('/store/orders/')
+        self.assertNotIn('count', response.data)
+        seen = [order['id'] for order in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen += [order['id'] for order in response.data['results']]
+        self.assertEqual(sorted(seen), sorted(Order.objects.values_list('id', flat=True)))
+
+    def test_orders_detail(self):
+        self.measure('orders-detail', 'get', f'/store/orders/{self.data["order"].id}/')
+
+    # Writes
+
+    def product_payload(self):
+        return {
+            'title': 'New product', 'slug': 'new-product', 'description': 'New', 'unit_price': '12.50',
+            'inventory': 10, 'collection': self.data['collection'].id,
+        }
+
+    def new_cart(self):
+        cart = Cart.objects.create()
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, product=product, quantity=1)
+            for product in Product.objects.order_by('id')[:BENCH_SIZE]
+        )
+        return cart
+
+    def test_collection_create(self):
+        self.measure('collection-create', 'post', '/store/collections', {'title': 'New collection'})
+
+    def test_collection_update(self):
+        self.measure('collection-update', 'put', f'/store/collections/{self.data["collection"].id}', {'title': 'Renamed'})
+
+    def test_collection_delete(self):
+        collection = Collection.objects.create(title='Empty')
+        self.measure('collection-delete', 'delete', f'/store/collections/{collection.id}', repeat=1)
+
+    def test_product_create(self):
+        self.measure('product-create', 'post', '/store/products/', self.product_payload)
+
+    def test_product_update(self):
+        self.measure('product-update', 'put', f'/store/products/{self.data["product"].id}/', self.product_payload)
+
+    def test_product_delete(self):
+        product = Product.objects.create(
+            title='Unsold', description='', slug='unsold', unit_price=1, inventory=1, collection=self.data['collection']
+        )
+        self.measure('product-delete', 'delete', f'/store/products/{product.id}/', repeat=1)
+
+    def test_product_review_detail(self):
+        review = Review.objects.filter(product=self.data['product']).first()
+        self.measure('product-review-detail', 'get', f'/store/products/{self.data["product"].id}/reviews/{review.id}/')
+
+    def test_product_review_create(self):
+        self.measure('product-review-create', 'post', f'/store/products/{self.data["product"].id}/reviews/', {
+            'name': 'Reviewer', 'description': 'Great'
+        })
+
+    def test_cart_create(self):
+        self.measure('cart-create', 'post', '/store/carts/', {})
+
+    def test_cart_delete(self):
+        self.measure('cart-delete', 'delete', f'/store/carts/{self.new_cart().id}/', repeat=1)
+
+    def test_cart_items_detail(self):
+        item = CartItem.objects.filter(cart=self.data['cart']).first()
+        self.measure('cart-items-detail', 'get', f'/store/carts/{self.data["cart"].id}/items/{item.id}/')
+
+    def test_cart_items_update(self):
+        item = CartItem.objects.filter(cart=self.data['cart']).first()
+        self.measure('cart-items-update', 'patch', f'/store/carts/{self.data["cart"].id}/items/{item.id}/', {'quantity': 3})
+
+    def test_cart_items_delete(self):
+        item = CartItem.objects.filter(cart=self.data['cart']).first()
+        self.measure('cart-items-delete', 'delete', f'/store/carts/{self.data["cart"].id}/items/{item.id}/', repeat=1)
+
+    def test_customer_detail(self):
+        self.measure('customer-detail', 'get', f'/store/customers/{self.data["customer"].id}/')
+
+    def test_customer_update(self):
+        self.measure('customer-update', 'put', f'/store/customers/{self.data["customer"].id}/', {
+            'phone': '555', 'membership': 'G'
+        })
+
+    def test_customer_delete(self):
+        user = User.objects.create(username='leaving', email='leaving@example.com')
+        customer = Customer.objects.create(user=user)
+        self.measure('customer-delete', 'delete', f'/store/customers/{customer.id}/', repeat=1)
+
+    def test_customer_profile_update(self):
+        self.measure('customer-profile-update', 'put', '/store/customers/profile/', {'phone': '555', 'membership': 'S'})
+
+    def test_orders_create(self):
+        # The cart holds BENCH_SIZE products, so per-item queries show up
+        get_customer_id(self.data['admin'])
+        self.measure('orders-create', 'post', '/store/orders/', {'cart_id': str(self.new_cart().id)}, repeat=1)
+
+    def test_orders_update(self):
+        self.measure('orders-update', 'patch', f'/store/orders/{self.data["order"].id}/', {'payment_status': 'C'})
+
+    def test_orders_delete(self):
+        order = Order.objects.create(customer=self.data['customer'])
+        self.measure('orders-delete', 'delete', f'/store/orders/{order.id}/', repeat=1)
+
+    def test_export(self):
+        self.measure('export', 'get', '/store/export/orders.ndjson')
+
+    def test_import(self):
+        lines = [
+            json.dumps({
+                'title': f'Imported {i}', 'slug': f'imported-{i}', 'unit_price': '3.00', 'inventory': 1,
+                'collection': self.data['collection'].title, 'promotions': ['Seed promotion'],
+            }) for i in range(BENCH_SIZE)
+        ]
+        self.measure('import', 'post', '/store/import/products.ndjson', lambda: {
+            'file': SimpleUploadedFile('products.ndjson', '\n'.join(lines).encode())
+        }, format='multipart')
+
+
+class DenormalizedCounterTest (TestCase):
+    def test_products_count_follows_product_writes(self):
+        first = Collection.objects.create(title='First')
+        second = Collection.objects.create(title='Second')
+        product = Product.objects.create(
+            title='Product', description='', slug='product', unit_price=1, inventory=1, collection=first
+        )
+        first.refresh_from_db()
+        self.assertEqual(first.products_count, 1)
+
+        product.collection = second
+        product.save()
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.products_count, second.products_count), (0, 1))
+
+        # update_fields may name the foreign key by its column
+        product.collection_id = first.id
+        product.save(update_fields=['collection_id'])
+        product.collection_id = second.id
+        product.save(update_fields=['collection'])
+        product.save(update_fields=['title'])
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.products_count, second.products_count), (0, 1))
+
+        review = Review.objects.create(product=product, name='Name', description='')
+        product.refresh_from_db()
+        self.assertEqual(product.reviews_count, 1)
+        other = Product.objects.create(
+            title='Other', description='', slug='other', unit_price=1, inventory=1, collection=first
+        )
+        review.product_id = other.id
+        review.save(update_fields=['product_id'])
+        self.assertEqual(
+            list(Product.objects.order_by('id').values_list('reviews_count', flat=True)), [0, 1]
+        )
+
+        product.delete()
+        second.refresh_from_db()
+        self.assertEqual(second.products_count, 0)
+
+    def test_rebuild_counters(self):
+        collection = Collection.objects.create(title='Collection')
+        Product.objects.bulk_create(
+            Product(title='Product', description='', slug='product', unit_price=1, inventory=1, collection=collection)
+            for i in range(3)
+        )
+        self.assertEqual(rebuild_collection_counts(batch_size=1), 1)
+        collection.refresh_from_db()
+        self.assertEqual(collection.products_count, 3)
+
+
+class ProductSearchTest (TestCase):
+    def test_index_follows_product_writes(self):
+        collection = Collection.objects.create(title='Collection')
+        product = Product.objects.create(
+            title='Walnut bread', description='Baked daily', slug='bread', unit_price=1, inventory=1, collection=collection
+        )
+        self.assertEqual(list(search_products(Product.objects.all(), 'walnut')), [product])
+
+        product.title = 'Rye bread'
+        product.save()
+        self.assertEqual(list(search_products(Product.objects.all(), 'walnut')), [])
+        self.assertEqual(list(search_products(Product.objects.all(), 'rye "bread')), [product])
+
+        product.delete()
+        self.assertEqual(list(search_products(Product.objects.all(), 'rye')), [])
+
+    def test_match_combines_with_other_filters(self):
+        bakery, pantry = Collection.objects.create(title='Bakery'), Collection.objects.create(title='Pantry')
+        Product.objects.bulk_create(
+            Product(title='Walnut', description='', slug=f'walnut-{i}', unit_price=1, inventory=1, collection=pantry)
+            for i in range(1100)
+        )
+        # Both rank below every pantry match
+        bread = Product.objects.create(
+            title='Walnut bread', description='Baked daily with flour', slug='bread', unit_price=1, inventory=1, collection=bakery
+        )
+        toast = Product.objects.create(
+            title='Toast', description='walnut', slug='toast', unit_price=1, inventory=1, collection=bakery
+        )
+        results = search_products(Product.objects.filter(collection=bakery), 'walnut')
+        self.assertEqual(results.count(), 2)
+        self.assertEqual(list(results), [toast, bread])
+        self.assertEqual(search_products(Product.objects.all(), 'walnut').count(), 1102)
+
+
+class CatalogCacheTest (TestCase):
+    def setUp(self):
+        cache.clear()
+        self.collection = Collection.objects.create(title='Collection')
+        self.product = Product.objects.create(
+            title='Product', description='', slug='product', unit_price=1, inventory=5, collection=self.collection
+        )
+
+    def test_product_reads_are_cached_until_a_write(self):
+        url = f'/store/products/{self.product.id}/'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(url)
+        # Only the validator aggregate runs on a cache hit
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(url).data['inventory'], 5)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.inventory = 7
+            self.product.save()
+        self.assertEqual(self.client.get(url).data['inventory'], 7)
+
+    def test_collection_list_is_invalidated_by_product_writes(self):
+        self.client.get('/store/collections')
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(
+                title='Other', description='', slug='other', unit_price=1, inventory=5, collection=self.collection
+            )
+        self.assertEqual(self.client.get('/store/collections').data[0]['products_count'], 2)
+
+    def test_non_numeric_pk_is_not_found(self):
+        self.assertEqual(self.client.get('/store/products/abc/').status_code, 404)
+
+    def test_conditional_get_answers_not_modified(self):
+        url = f'/store/products/{self.product.id}/'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(
+            self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(product=self.product, name='Name', description='')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['reviews_count'], 1)
+
+    def test_writes_only_retire_the_written_product(self):
+        other = Product.objects.create(
+            title='Other', description='', slug='other', unit_price=1, inventory=5, collection=self.collection
+        )
+        user = User.objects.create_user(username='user', email='user@example.com', password='secret')
+        url = f'/store/products/{self.product.id}/'
+        etag = self.client.get(url)['ETag']
+        other_etag = self.client.get(f'/store/products/{other.id}/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            other.likes.create(user=user)
+            reserve_inventory({other.id: 1})
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        response = self.client.get(f'/store/products/{other.id}/', HTTP_IF_NONE_MATCH=other_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['inventory'], 4)
+        self.assertEqual(response.data['likes_count'], 1)
+
+
+class GenericRelationTest (TestCase):
+    def setUp(self):
+        cache.clear()
+        self.collection = Collection.objects.create(title='Collection')
+        self.product = Product.objects.create(
+            title='Product', description='', slug='product', unit_price=1, inventory=5, collection=self.collection
+        )
+        self.user = User.objects.create_user(username='user', email='user@example.com', password='secret')
+        self.tag = Tag.objects.create(label='Sale')
+
+    def test_product_payload_includes_tags_and_likes(self):
+        self.product.tags.create(tag=self.tag)
+        self.product.likes.create(user=self.user)
+        data = self.client.get(f'/store/products/{self.product.id}/').data
+        self.assertEqual(data['tags'], ['Sale'])
+        self.assertEqual(data['likes_count'], 1)
+
+    def test_likes_invalidate_the_catalog(self):
+        url = f'/store/products/{self.product.id}/'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.likes.create(user=self.user)
+        self.assertEqual(self.client.get(url).data['likes_count'], 1)
+
+    def test_content_objects_resolve_with_one_query_per_type(self):
+        self.product.tags.create(tag=self.tag)
+        Product.objects.create(
+            title='Other', description='', slug='other', unit_price=1, inventory=5, collection=self.collection
+        ).tags.create(tag=self.tag)
+        TaggedItem.objects.create(
+            tag=self.tag, content_type=ContentType.objects.get_for_model(Collection), object_id=self.collection.pk
+        )
+        items = TaggedItem.objects.order_by('id')
+        other = Product.objects.get(slug='other')
+        # The tagged items, then the products and the collection
+        with self.assertNumQueries(3):
+            items = resolve_content_objects(items)
+            self.assertEqual([item.content_object for item in items], [self.product, other, self.collection])
+
+
+class PricingTest (TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        collection = Collection.objects.create(title='Collection')
+        cls.product = Product.objects.create(
+            title='Product', description='', slug='product', unit_price=Decimal('19.99'), inventory=5, collection=collection
+        )
+        cls.product.promotions.add(
+            Promotion.objects.create(description='Small', discount=0.05),
+            Promotion.objects.create(description='Big', discount=0.25),
+        )
+        cls.plain = Product.objects.create(
+            title='Plain', description='', slug='plain', unit_price=Decimal('10.00'), inventory=5, collection=collection
+        )
+
+    def test_prices_are_exact_and_use_the_best_promotion(self):
+        products = list(Product.objects.order_by('id'))
+        with self.assertNumQueries(1):
+            price_products(products)
+        self.assertEqual(products[0].effective_price, Decimal('14.99'))
+        self.assertEqual(products[0].price_with_tax, Decimal('16.49'))
+        self.assertEqual(products[1].effective_price, Decimal('10.00'))
+        self.assertEqual(products[1].price_with_tax, Decimal('11.00'))
+
+    def test_prefetched_promotions_need_no_query(self):
+        products = list(Product.objects.prefetch_related('promotions'))
+        with self.assertNumQueries(0):
+            price_products(products)
+
+    def test_effective_price_ordering_and_filtering(self):
+        cache.clear()
+        response = self.client.get('/store/products/?ordering=-effective_price')
+        self.assertEqual([product['title'] for product in response.data['results']], ['Product', 'Plain'])
+        response = self.client.get('/store/products/?effective_price__lt=12')
+        self.assertEqual([product['title'] for product in response.data['results']], ['Plain'])
+        response = self.client.get('/store/products/?effective_price__gte=14.99')
+        self.assertEqual(response.data['results'][0]['effective_price'], Decimal('14.99'))
+
+    def test_effective_price_filters_match_the_shown_price(self):
+        cache.clear()
+        product = Product.objects.create(
+            title='Rounded', description='', slug='rounded', unit_price=Decimal('19.99'), inventory=1,
+            collection=Collection.objects.get()
+        )
+        product.promotions.add(Promotion.objects.create(description='Five', discount=0.05))
+        # 19.99 * 0.95 = 18.9905, shown as 18.99
+        response = self.client.get('/store/products/?effective_price__lte=18.99&effective_price__gte=18.99')
+        self.assertEqual([item['effective_price'] for item in response.data['results']], [Decimal('18.99')])
+        response = self.client.get('/store/products/?effective_price__gt=18.99&effective_price__lt=19')
+        self.assertEqual(response.data['results'], [])
+
+    def test_out_of_range_discounts_are_clamped_in_sql(self):
+        self.plain.promotions.add(Promotion.objects.create(description='Too much', discount=1.5))
+        product = with_effective_price(Product.objects.filter(pk=self.plain.pk)).get()
+        self.assertEqual((product.best_discount, product.effective_price), (1.0, Decimal('0.00')))
+
+        Promotion.objects.filter(description='Too much').update(discount=-0.5)
+        product = with_effective_price(Product.objects.filter(pk=self.plain.pk)).get()
+        self.assertEqual((product.best_discount, product.effective_price), (0.0, Decimal('10.00')))
+        price_products([product])
+        self.assertEqual(product.effective_price, Decimal('10.00'))
+
+    def test_cart_total_uses_effective_price(self):
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        CartItem.objects.create(cart=cart, product=self.plain, quantity=1)
+        response = self.client.get(f'/store/carts/{cart.id}/')
+        self.assertEqual(Decimal(str(response.data['total_price'])), Decimal('39.98'))
+
+
+class CheckoutInventoryTest (TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', email='buyer@example.com')
+        Customer.objects.create(user=cls.user)
+        collection = Collection.objects.create(title='Collection')
+        cls.product = Product.objects.create(
+            title='Hot item', description='', slug='hot', unit_price=5, inventory=3, collection=collection
+        )
+
+    def setUp(self):
+        cache.clear()
+
+    def checkout(self, quantity):
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.product, quantity=quantity)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client.post('/store/orders/', {'cart_id': str(cart.id)}, format='json')
+
+    def test_checkout_decrements_inventory(self):
+        response = self.checkout(2)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['orderitem_set'][0]['product']['inventory'], 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 1)
+
+    def test_checkout_query_count_does_not_depend_on_cart_size(self):
+        counts = []
+        get_customer_id(self.user)
+        for size in [1, 10]:
+            cart = Cart.objects.create()
+            products = Product.objects.bulk_create(
+                Product(title='Item', description='', slug='item', unit_price=2, inventory=5, collection=self.product.collection)
+                for i in range(size)
+            )
+            CartItem.objects.bulk_create(CartItem(cart=cart, product=product, quantity=1) for product in products)
+            client = APIClient()
+            client.force_authenticate(self.user)
+            with CaptureQueriesContext(connection) as context:
+                response = client.post('/store/orders/', {'cart_id': str(cart.id)}, format='json')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(len(response.data['orderitem_set']), size)
+            counts.append(count_queries(context))
+        self.assertEqual(counts[0], counts[1])
+        self.assertLessEqual(counts[0], 8)
+
+    def test_customer_id_is_cached_across_requests(self):
+        cache.clear()
+        user = User.objects.get(pk=self.user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(get_customer_id(user), self.user.customer.id)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_customer_id(User(pk=self.user.pk)), self.user.customer.id)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.customer.delete()
+        self.assertIsNone(cache.get(customer_id_cache_key(self.user.pk)))
+
+    def test_checkout_rejects_unknown_and_empty_carts(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/store/orders/', {'cart_id': str(uuid4())}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = client.post('/store/orders/', {'cart_id': str(Cart.objects.create().id)}, format='json')
+        self.assertEqual(response.data['cart_id'], ['Cart is Empty'])
+
+    def test_checkout_rejects_oversell(self):
+        response = self.checkout(4)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['out_of_stock'], [str(self.product.id)])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.inventory, 3)
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(ASYNC_CHECKOUT=True)
+class AsyncCheckoutTest (TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='buyer', email='buyer@example.com')
+        collection = Collection.objects.create(title='Collection')
+        cls.product = Product.objects.create(
+            title='Hot item', description='', slug='hot', unit_price=5, inventory=1, collection=collection
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def checkout(self):
+        cart = Cart.objects.create()
+        CartItem.objects.create(cart=cart, product=self.product, quantity=1)
+        response = self.client.post('/store/orders/', {'cart_id': str(cart.id)}, format='json')
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.data['payment_status'], Order.PAYMENT_STATUS_QUEUED)
+        return response.data['id']
+
+    def test_worker_finalizes_queued_orders(self):
+        first = self.checkout()
+        second = self.checkout()
+        self.assertEqual(run_pending_jobs(), 2)
+
+        response = self.client.get(f'/store/orders/{first}/')
+        self.assertEqual(response.data['payment_status'], Order.PAYMENT_STATUS_PENDING)
+        self.assertEqual(len(response.data['orderitem_set']), 1)
+        response = self.client.get(f'/store/orders/{second}/')
+        self.assertEqual(response.data['payment_status'], Order.PAYMENT_STATUS_FAILED)
+        self.assertEqual(Job.objects.filter(status=Job.STATUS_DONE).count(), 2)
+
+    def test_rerun_job_leaves_a_finalized_order_alone(self):
+        order_id = self.checkout()
+        job = Job.objects.get(kind='checkout')
+        run_job(job)
+        # claim_job hands the job out again, as if its worker had died
+        run_job(job)
+        order = Order.objects.get(pk=order_id)
+        self.assertEqual(order.payment_status, Order.PAYMENT_STATUS_PENDING)
+        self.assertEqual(order.orderitem_set.count(), 1)
+
+    def test_unexpected_error_fails_the_order(self):
+        order_id = self.checkout()
+        with mock.patch('store.checkout.fill_order', side_effect=RuntimeError('database went away')):
+            self.assertEqual(run_pending_jobs(), 1)
+        self.assertEqual(Job.objects.get().status, Job.STATUS_FAILED)
+        self.assertEqual(Order.objects.get(pk=order_id).payment_status, Order.PAYMENT_STATUS_FAILED)
+
+    def test_unknown_cart_is_rejected_before_queueing(self):
+        response = self.client.post('/store/orders/', {'cart_id': str(uuid4())}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Job.objects.exists())
+
+
+class AdminChangelistTest (TestCase):
+    changelists = ['order', 'customer', 'product', 'collection']
+
+    def setUp(self):
+        self.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='admin')
+        self.client.force_login(self.admin)
+
+    def add_rows(self, start, count):
+        collection = Collection.objects.create(title=f'Collection {start}')
+        Product.objects.bulk_create(
+            Product(title=f'Product {i}', description='', slug=f'product-{i}', unit_price=1, inventory=i, collection=collection)
+            for i in range(start, start + count)
+        )
+        users = User.objects.bulk_create(
+            User(username=f'user{i}', email=f'user{i}@example.com', first_name=f'First {i}') for i in range(start, start + count)
+        )
+        customers = Customer.objects.bulk_create(Customer(user=user) for user in users)
+        Order.objects.bulk_create(Order(customer=customer) for customer in customers)
+
+    def changelist_queries(self):
+        counts = {}
+        for model in self.changelists:
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(self.client.get(f'/admin/store/{model}/').status_code, 200)
+            counts[model] = len(context.captured_queries)
+        return counts
+
+    def test_query_count_does_not_depend_on_rows(self):
+        self.add_rows(0, 3)
+        small = self.changelist_queries()
+        self.add_rows(3, 12)
+        self.assertEqual(self.changelist_queries(), small)
+
+    def test_collection_counts_link_to_their_products(self):
+        self.add_rows(0, 3)
+        collection = Collection.objects.get()
+        response = self.client.get('/admin/store/collection/')
+        self.assertContains(response, f'?collection__id={collection.id}')
+
+    def test_large_tables_use_the_estimated_count(self):
+        self.add_rows(0, 15)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        queryset = Product.objects.order_by('id')
+        with override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=10):
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(EstimatedCountPaginator(queryset, 10).count, 15)
+            self.assertNotIn('COUNT(', context.captured_queries[0]['sql'])
+            # Filtered changelists are counted exactly
+            self.assertEqual(EstimatedCountPaginator(queryset.filter(inventory__lt=5), 10).count, 5)
+        with override_settings(ADMIN_ESTIMATED_COUNT_THRESHOLD=100):
+            with CaptureQueriesContext(connection) as context:
+                self.assertEqual(EstimatedCountPaginator(queryset, 10).count, 15)
+            self.assertIn('COUNT(', context.captured_queries[-1]['sql'])
+
+
+class BulkProductActionTest (TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='admin')
+        self.client.force_login(self.admin)
+        collection = Collection.objects.create(title='Collection')
+        self.products = Product.objects.bulk_create(
+            Product(title=f'Product {i}', description='', slug=f'product-{i}', unit_price=Decimal('10.00'), inventory=50, collection=collection)
+            for i in range(5)
+        )
+
+    def post_action(self, action, **params):
+        return self.client.post('/admin/store/product/', {
+            'action': action,
+            '_selected_action': [product.id for product in self.products],
+            'index': 0,
+            **params
+        })
+
+    @override_settings(BULK_ACTION_CHUNK_SIZE=2)
+    def test_actions_update_the_selection_in_chunks(self):
+        updated_before = Product.objects.get(pk=self.products[0].pk).last_update
+        with CaptureQueriesContext(connection) as context:
+            self.post_action('adjust_price', percent='12.5')
+        # One UPDATE per chunk
+        updates = [query for query in context.captured_queries if query['sql'].startswith('UPDATE "store_product"')]
+        self.assertEqual(len(updates), 3)
+        self.assertEqual(
+            set(Product.objects.values_list('unit_price', flat=True)), {Decimal('11.25')}
+        )
+        self.assertGreater(Product.objects.get(pk=self.products[0].pk).last_update, updated_before)
+
+        self.post_action('set_inventory', inventory=7)
+        self.assertEqual(set(Product.objects.values_list('inventory', flat=True)), {7})
+
+        promotion = Promotion.objects.create(description='Sale', discount=0.2)
+        self.products[0].promotions.add(promotion)
+        self.post_action('assign_promotion', promotion=promotion.id)
+        self.assertEqual(promotion.product_set.count(), 5)
+
+    def test_missing_parameter_changes_nothing(self):
+        self.post_action('set_inventory')
+        self.assertEqual(set(Product.objects.values_list('inventory', flat=True)), {50})
+
+    def test_progress_is_reported_per_chunk(self):
+        progress = []
+        updated = apply_in_chunks(
+            'set_inventory', pk_chunks(Product.objects.all(), 2), {'inventory': 0}, 5,
+            progress=lambda processed, total: progress.append((processed, total))
+        )
+        self.assertEqual(updated, 5)
+        self.assertEqual(progress, [(2, 5), (4, 5), (5, 5)])
+
+    @override_settings(BULK_ACTION_BACKGROUND_THRESHOLD=3)
+    def test_large_selections_run_in_the_worker(self):
+        self.post_action('clear_inventory')
+        self.assertEqual(set(Product.objects.values_list('inventory', flat=True)), {50})
+        # One job per BULK_ACTION_BACKGROUND_THRESHOLD products
+        jobs = Job.objects.filter(kind='bulk_products').order_by('id')
+        self.assertEqual([len(job.payload['ids']) for job in jobs], [3, 2])
+
+        self.assertEqual(run_pending_jobs(), 2)
+        self.assertEqual([(job.status, job.result['updated']) for job in jobs.all()], [(Job.STATUS_DONE, 3), (Job.STATUS_DONE, 2)])
+        self.assertEqual(set(Product.objects.values_list('inventory', flat=True)), {0})
+
+    def test_price_overflow_is_rejected_before_any_update(self):
+        Product.objects.filter(pk=self.products[-1].pk).update(unit_price=Decimal('9000'))
+        response = self.post_action('adjust_price', percent='12')
+        self.assertIn(
+            'The adjusted price of some products would exceed 9999.99',
+            [str(message) for message in get_messages(response.wsgi_request)]
+        )
+        self.assertEqual(Product.objects.filter(unit_price=Decimal('10')).count(), 4)
+
+
+class ExportTest (TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='admin')
+        cls.customer = Customer.objects.create(user=cls.admin, phone='555')
+        collection = Collection.objects.create(title='Collection')
+        cls.products = Product.objects.bulk_create(
+            Product(title=f'Product {i}', description='', slug=f'product-{i}', unit_price=Decimal('9.50'), inventory=i, collection=collection)
+            for i in range(5)
+        )
+        order = Order.objects.create(customer=cls.customer)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, product=product, quantity=2, unit_price=Decimal('9.50')) for product in cls.products[:3]
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.admin)
+
+    def streamed(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_products_csv(self):
+        lines = self.streamed('/store/export/products.csv').splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'title', 'slug'])
+        self.assertEqual(len(lines), 6)
+        self.assertEqual(lines[1].split(',')[1:3], ['Product 0', 'product-0'])
+
+    def test_orders_ndjson_has_a_row_per_item(self):
+        rows = [json.loads(line) for line in self.streamed('/store/export/orders.ndjson').splitlines()]
+        self.assertEqual([row['product_id'] for row in rows], [product.id for product in self.products[:3]])
+        self.assertEqual(rows[0]['unit_price'], '9.50')
+        self.assertEqual(rows[0]['order__customer_id'], self.customer.id)
+
+    @override_settings(EXPORT_CHUNK_SIZE=2)
+    def test_rows_are_read_in_chunks(self):
+        response = self.client.get('/store/export/products.ndjson')
+        with CaptureQueriesContext(connection) as context:
+            lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual(len(lines), 5)
+        self.assertEqual(len(context.captured_queries), 3)
+
+    def test_export_is_staff_only(self):
+        self.client.force_authenticate(user=User.objects.create_user(username='user', email='user@example.com', password='secret'))
+        self.assertEqual(self.client.get('/store/export/customers.csv').status_code, 403)
+        self.client.force_authenticate(user=self.admin)
+        self.assertEqual(self.client.get('/store/export/carts.csv').status_code, 404)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('export_store', 'customers', '--format', 'ndjson', stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['phone'], '555')
+
+
+class CatalogImportTest (TestCase):
+    def setUp(self):
+        cache.clear()
+        self.collection = Collection.objects.create(title='Shoes')
+        self.promotion = Promotion.objects.create(description='Summer', discount=0.1)
+        self.existing = Product.objects.create(
+            title='Old', description='', slug='boot', unit_price=1, inventory=1, collection=self.collection
+        )
+
+    def product_lines(self, count, start=0):
+        return [
+            json.dumps({
+                'title': f'Product {i}', 'slug': f'product-{i}', 'unit_price': '4.50',
+                'inventory': i, 'collection': 'Shoes', 'promotions': ['Summer'],
+            }) for i in range(start, start + count)
+        ]
+
+    def run_import(self, kind, lines, format='ndjson', **options):
+        errors = []
+        result = CatalogImport(kind, report=lambda line, record_errors: errors.append(line), **options) \
+            .run(read_records(lines, format))
+        return result, errors
+
+    def test_products_are_upserted_on_slug(self):
+        lines = self.product_lines(2) + [
+            json.dumps({'title': 'Boot', 'slug': 'boot', 'unit_price': '9.99', 'inventory': 3, 'collection': 'Shoes'}),
+            json.dumps({'title': 'Bad', 'slug': 'bad', 'unit_price': '-1', 'inventory': 3, 'collection': 'Shoes'}),
+            json.dumps({'title': 'Lost', 'slug': 'lost', 'unit_price': '1', 'inventory': 3, 'collection': 'Hats'}),
+            'not json',
+        ]
+        result, errors = self.run_import('products', lines)
+        self.assertEqual((result.created, result.updated, result.failed), (2, 1, 3))
+        self.assertEqual(sorted(errors), [4, 5, 6])
+
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.title, self.existing.unit_price), ('Boot', Decimal('9.99')))
+        self.assertEqual(self.promotion.product_set.count(), 2)
+        self.collection.refresh_from_db()
+        self.assertEqual(self.collection.products_count, 3)
+
+    def test_query_count_does_not_depend_on_batch_size(self):
+        with CaptureQueriesContext(connection) as small:
+            self.run_import('products', self.product_lines(3))
+        with CaptureQueriesContext(connection) as large:
+            self.run_import('products', self.product_lines(12, start=3))
+        self.assertEqual(count_queries(small), count_queries(large))
+
+    def test_dry_run_writes_nothing(self):
+        result, errors = self.run_import('products', self.product_lines(3), dry_run=True)
+        self.assertEqual(result.created, 3)
+        self.assertEqual(Product.objects.count(), 1)
+
+    def test_collections_and_promotions_from_csv(self):
+        result, errors = self.run_import('collections', StringIO('title\nShoes\nHats\nHats\n'), 'csv')
+        self.assertEqual(result.created, 1)
+        self.assertEqual(Collection.objects.filter(title='Hats').count(), 1)
+
+        result, errors = self.run_import('promotions', StringIO('description,discount\nSummer,0.3\nWinter,0.2\n'), 'csv')
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.promotion.refresh_from_db()
+        self.assertEqual(self.promotion.discount, 0.3)
+
+    def test_unreadable_lines_are_rejected(self):
+        result, errors = self.run_import('collections', StringIO('title\nHats\nBoots,Extra\n'), 'csv')
+        self.assertEqual((result.created, result.failed), (1, 1))
+        self.assertEqual(errors, [3])
+        self.assertFalse(Collection.objects.filter(title='Boots').exists())
+
+        admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='admin')
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        upload = SimpleUploadedFile('collections.csv', 'title\nSocks\n'.encode() + b'Caf\xe9\n' + 'Belts\n'.encode())
+        response = client.post('/store/import/collections.csv', {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['failed']), (2, 1))
+        self.assertEqual(response.data['errors'], [{'line': 3, 'errors': {'non_field_errors': ['Not valid UTF-8']}}])
+
+    def test_command_and_endpoint(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'products.csv')
+            report = os.path.join(directory, 'errors.ndjson')
+            with open(path, 'w') as file:
+                file.write('title,slug,unit_price,inventory,collection,promotions\n')
+                file.write('Sandal,sandal,3.00,4,Shoes,Summer\n')
+                file.write('Hat,hat,3.00,4,Hats,\n')
+            out = StringIO()
+            call_command('import_catalog', 'products', path, '--error-report', report, stdout=out)
+            self.assertIn('created 1 and updated 0 products; 1 records rejected', out.getvalue())
+            with open(report) as file:
+                self.assertEqual(json.loads(file.read())['line'], 3)
+
+        admin = User.objects.create_superuser(username='admin', email='admin@example.com', password='admin')
+        client = APIClient()
+        client.force_authenticate(user=admin)
+        upload = SimpleUploadedFile('products.ndjson', '\n'.join(self.product_lines(2)).encode())
+        response = client.post('/store/import/products.ndjson?dry_run=1', {'file': upload})
+        self.assertEqual(response.data['created'], 2)
+        self.assertEqual(Product.objects.filter(slug__startswith='product-').count(), 0)
+
+
+@override_settings(CART_TTL=3600)
+class CartExpiryTest (TestCase):
+    def setUp(self):
+        collection = Collection.objects.create(title='Collection')
+        self.product = Product.objects.create(
+            title='Product', description='', slug='product', unit_price=1, inventory=5, collection=collection
+        )
+        idle = timezone.now() - timedelta(hours=2)
+        self.expired = Cart.objects.bulk_create(Cart(last_activity=idle) for i in range(5))
+        CartItem.objects.bulk_create(CartItem(cart=cart, product=self.product, quantity=1) for cart in self.expired)
+        self.active = Cart.objects.create()
+
+    def test_item_writes_keep_the_cart_alive(self):
+        cart = self.expired[0]
+        response = self.client.post(f'/store/carts/{cart.id}/items/', {'product_id': self.product.id, 'quantity': 1})
+        self.assertEqual(response.status_code, 201)
+        cart.refresh_from_db()
+        self.assertGreater(cart.last_activity, timezone.now() - timedelta(minutes=1))
+        self.assertEqual(reap_carts(), {'carts': 4, 'items': 4})
+        self.assertTrue(Cart.objects.filter(pk=cart.pk).exists())
+
+    def test_expired_carts_are_deleted_in_batches(self):
+        self.assertEqual(reap_carts(batch_size=2, limit=3), {'carts': 3, 'items': 3})
+        out = StringIO()
+        call_command('reap_carts', '--batch-size', '2', stdout=out)
+        self.assertIn('Deleted 2 carts and 2 cart items', out.getvalue())
+        self.assertEqual(list(Cart.objects.values_list('pk', flat=True)), [self.active.pk])
+
+    def test_items_of_unknown_cart(self):
+        items = CartItem.objects.count()
+        for cart_id in (uuid4(), 'abc'):
+            response = self.client.post(
+                f'/store/carts/{cart_id}/items/bulk/', {'items': [{'product_id': self.product.id, 'quantity': 1}]},
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 404)
+            response = self.client.post(f'/store/carts/{cart_id}/items/', {'product_id': self.product.id, 'quantity': 1})
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(self.client.get(f'/store/carts/{cart_id}/items/').status_code, 404 if cart_id == 'abc' else 200)
+        self.assertEqual(CartItem.objects.count(), items)
+
+
+class HotProductCheckoutBenchmark (TransactionTestCase):
+    """Many buyers check out the same product at once; none may oversell."""
+
+    BUYERS = int(os.environ.get('STORE_BENCH_BUYERS', 16))
+
+    def test_concurrent_checkouts_do_not_oversell(self):
+        collection = Collection.objects.create(title='Collection')
+        stock = self.BUYERS // 2
+        product = Product.objects.create(
+            title='Hot item', description='', slug='hot', unit_price=5, inventory=stock, collection=collection
+        )
+        users = [User.objects.create_user(username=f'buyer{i}', email=f'buyer{i}@example.com') for i in range(self.BUYERS)]
+        carts = []
+        for user in users:
+            cart = Cart.objects.create()
+            CartItem.objects.create(cart=cart, product=product, quantity=1)
+            carts.append((user, cart))
+
+        def checkout(user_and_cart):
+            user, cart = user_and_cart
+            client = APIClient()
+            client.force_authenticate(user)
+            try:
+                return client.post('/store/orders/', {'cart_id': str(cart.id)}, format='json').status_code
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            codes = list(executor.map(checkout, carts))
+        elapsed = time.perf_counter() - start
+        print(f'\n{self.BUYERS} concurrent checkouts of one product: {self.BUYERS / elapsed:.1f} checkouts/s')
+
+        product.refresh_from_db()
+        self.assertEqual(codes.count(200), stock)
+        self.assertEqual(product.inventory, 0)
+        self.assertEqual(OrderItem.objects.filter(product=product).count(), stock)
+
+
+class ConcurrentCartAddTest (TransactionTestCase):
+    """Concurrent adds of the same product to one cart must all count."""
+
+    ADDS = 16
+
+    def test_concurrent_adds_to_the_same_line(self):
+        collection = Collection.objects.create(title='Collection')
+        product = Product.objects.create(
+            title='Product', description='', slug='product', unit_price=5, inventory=100, collection=collection
+        )
+        cart = Cart.objects.create()
+        url = f'/store/carts/{cart.id}/items/'
+
+        def add(i):
+            # The line does not exist yet, so the first adds race to insert it;
+            # every other add goes through the bulk endpoint
+            try:
+                if i % 2:
+                    data = {'items': [{'product_id': product.id, 'quantity': 2}]}
+                    return APIClient().post(f'{url}bulk/', data, format='json').status_code
+                return APIClient().post(url, {'product_id': product.id, 'quantity': 2}, format='json').status_code
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            codes = list(executor.map(add, range(self.ADDS)))
+
+        self.assertEqual(sorted(set(codes)), [200, 201])
+        item = CartItem.objects.get(cart=cart, product=product)
+        self.assertEqual(item.quantity, 2 * self.ADDS)
+
+
+class SuggestIndexesTest (TransactionTestCase):
+    def test_proposes_index_for_scanned_column(self):
+        collection = Collection.objects.create(title='Collection')
+        Product.objects.bulk_create(
+            Product(title=f'Product {i}', description='', slug=f'product-{i}', unit_price=1, inventory=i, collection=collection)
+            for i in range(50)
+        )
+        with CaptureQueriesContext(connection) as context:
+            list(Product.objects.filter(title='Product 7'))
+            list(Product.objects.filter(inventory__lt=10))
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as capture:
+            for query in context.captured_queries:
+                capture.write(json.dumps({'endpoint': 'test', 'sql': query['sql']}) + '\n')
+        out = StringIO()
+        call_command('suggest_indexes', capture.name, repeat=1, stdout=out)
+        os.unlink(capture.name)
+        self.assertIn("store.Product: models.Index(fields=['title'])", out.getvalue())
+        # inventory is already indexed through Product.Meta.indexes
+        self.assertNotIn("fields=['inventory']", out.getvalue())
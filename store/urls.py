@@ -25,6 +25,8 @@ urlpatterns = [
     # path('products/<int:id>', views.ProductDetail.as_view()),
     path('collections', views.collection_list),
     path('collections/<int:id>', views.collection_details),
+    path('export/<str:name>.<str:suffix>', views.export),
+    path('import/<str:kind>.<str:suffix>', views.import_catalog),
 
     #This kind of path definition, as opposed to the above, is used for viewset views (not class based views or functin based )
     path('', include(router.urls)),
@@ -1,27 +1,42 @@
+import io
+from django.conf import settings
+from django.core.exceptions import ValidationError as DjangoValidationError
 from django.shortcuts import get_object_or_404
-from django.http import HttpResponse
-from rest_framework.decorators import api_view
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework import status
 from .models import  Collection, Product, Order, OrderItem, Review, Cart, CartItem, Customer
 from .serializers import (CollectionSerializer,UpdateCartItemSerializer, CartItemSerializer, 
-                          AddCartItemSerializer, ProductSerializer, ReviewSerializer, CartSerializer, 
+                          AddCartItemSerializer, BulkCartItemSerializer, CatalogProductSerializer, ProductSerializer, ReviewSerializer, CartSerializer, 
                           CustomerSerializer, OrderSerializer, OrderItemSerializer, CreateOrderSerializer, UpdateOrderSerializer)
 from rest_framework.views import APIView
-from rest_framework.filters import SearchFilter, OrderingFilter
+from rest_framework.filters import OrderingFilter
 from rest_framework.pagination import PageNumberPagination
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.viewsets import ModelViewSet
 from rest_framework.decorators import action
+from django.db.models import Prefetch, prefetch_related_objects
+from .pagination import DefaultPagination, OrderCursorPagination, ReviewCursorPagination
+from django.utils.decorators import method_decorator
+from .carts import touch_cart
+from .catalog_import import ENCODING_ERRORS as IMPORT_ENCODING_ERRORS, FORMATS as IMPORT_FORMATS, CatalogImport, read_records
+from .customers import get_customer_id
+from .export import EXPORTS, FORMATS, export_lines
+from .cache import cache_catalog_response, conditional_catalog_response
+from .filters import ProductFilter
+from .pricing import with_effective_price
+from .search import ProductSearchFilter
+from .social import with_tags_and_likes
 from .permissions import isAdminOrReadOnly, ViewCustomerHistoryPermission
 from rest_framework.permissions import IsAuthenticated, AllowAny, IsAdminUser, DjangoModelPermissions
-from django.db.models import Count
 
 # Create your views here.
 
 class ReviewViewSet (ModelViewSet):
    # queryset = Review.objects.all()
    serializer_class = ReviewSerializer
+   pagination_class = ReviewCursorPagination
 
    def get_queryset(self):
       return Review.objects.filter(product_id = self.kwargs['product_pk'])
@@ -32,13 +47,13 @@ class ReviewViewSet (ModelViewSet):
    
 
 class ProductViewSet (ModelViewSet):
-   queryset = Product.objects.all()
-   serializer_class = ProductSerializer
-   filter_backends = [DjangoFilterBackend, SearchFilter, OrderingFilter]
+   queryset = with_tags_and_likes(with_effective_price(Product.objects.all()))
+   serializer_class = CatalogProductSerializer
+   filter_backends = [DjangoFilterBackend, ProductSearchFilter, OrderingFilter]
    pagination_class= PageNumberPagination
-   filterset_fields = ['collection_id']
+   filterset_class = ProductFilter
    search_fields = ['title', 'description']
-   ordering_fields = ['unit_price', 'last_update']
+   ordering_fields = ['unit_price', 'effective_price', 'last_update']
    permission_classes = [isAdminOrReadOnly]
    # We can also use filter_class in place of filter_fields for generic filter , such as filtering less than or greater than a value 
 
@@ -53,6 +68,18 @@ class ProductViewSet (ModelViewSet):
 
    def get_serializer_context(self):
       return {'request': self.request}
+
+   # Any product write changes the validators of the list, whatever filters
+   # the request applies, so the aggregate runs over the whole table
+   @method_decorator(conditional_catalog_response(lambda request, *args, **kwargs: Product.objects.all()))
+   @method_decorator(cache_catalog_response)
+   def list (self, request, *args, **kwargs):
+      return super().list(request, *args, **kwargs)
+
+   @method_decorator(conditional_catalog_response(lambda request, *args, **kwargs: Product.objects.filter(pk=kwargs['pk']), versioned=False))
+   @method_decorator(cache_catalog_response)
+   def retrieve (self, request, *args, **kwargs):
+      return super().retrieve(request, *args, **kwargs)
    
    def delete (self, request, pk):
       product = get_object_or_404(Product, pk=pk)
@@ -63,8 +90,9 @@ class ProductViewSet (ModelViewSet):
 
 
 class CartViewSet (ModelViewSet):
-   queryset = Cart.objects.prefetch_related('cartitem_set__product').all()
+   queryset = Cart.objects.prefetch_related('cartitem_set__product__promotions').order_by('created_at')
    serializer_class = CartSerializer
+   pagination_class = DefaultPagination
    
       
 class CartItemViewSet (ModelViewSet):
@@ -76,17 +104,54 @@ class CartItemViewSet (ModelViewSet):
          return UpdateCartItemSerializer
       return CartItemSerializer
    
+   def initial(self, request, *args, **kwargs):
+      # Cart ids are UUIDs; anything else names no cart
+      try:
+         self.kwargs['cart_pk'] = Cart._meta.pk.to_python(self.kwargs['cart_pk'])
+      except DjangoValidationError:
+         raise Http404
+      super().initial(request, *args, **kwargs)
+
    def get_serializer_context(self):
       return {'cart_id': self.kwargs['cart_pk']}  
      
    def get_queryset(self):
       # print(self.kwargs['cart_pk'])
-      return CartItem.objects.filter(cart_id=self.kwargs['cart_pk'])
+      return CartItem.objects.select_related('product').filter(cart_id=self.kwargs['cart_pk'])
+
+   # Every write keeps the cart from expiring (store.carts)
+   def perform_create(self, serializer):
+      # The activity update doubles as the check that the cart exists
+      if not touch_cart(self.kwargs['cart_pk']):
+         raise Http404
+      super().perform_create(serializer)
+
+   def perform_update(self, serializer):
+      super().perform_update(serializer)
+      touch_cart(self.kwargs['cart_pk'])
+
+   def perform_destroy(self, instance):
+      super().perform_destroy(instance)
+      touch_cart(self.kwargs['cart_pk'])
+
+   @action(detail=False, methods=['POST'])
+   def bulk (self, request, cart_pk):
+      # Applies many {product_id, quantity} operations in one transaction and
+      # answers with the resulting cart
+      if not touch_cart(self.kwargs['cart_pk']):
+         raise Http404
+      cart = Cart(pk=self.kwargs['cart_pk'])
+      serializer = BulkCartItemSerializer(data=request.data, context={'cart_id': cart.id})
+      serializer.is_valid(raise_exception=True)
+      serializer.save()
+      prefetch_related_objects([cart], 'cartitem_set__product__promotions')
+      return Response(CartSerializer(cart).data)
 
    
 class CustomerViewSet(ModelViewSet):
-    queryset = Customer.objects.all()
+    queryset = Customer.objects.order_by('id')
     serializer_class = CustomerSerializer
+    pagination_class = DefaultPagination
     permission_classes = [IsAuthenticated]
     
     #This function is an alternative to the permission_classes atttribute defined above, especially if you want to explicitly set permission on each request methods
@@ -117,6 +182,7 @@ class OrderViewSet(ModelViewSet):
    #  queryset = Order.objects.all()
    #  serializer_class = OrderSerializer
    #  permission_classes = [IsAuthenticated]
+    pagination_class = OrderCursorPagination
     
     def get_permissions (self):
        if self.request.method in ['PUT', 'PATCH', 'DELETE']:
@@ -126,9 +192,15 @@ class OrderViewSet(ModelViewSet):
     def create (self, request):
        serializer = CreateOrderSerializer(
           data= request.data,
-          context = {'user_id': self.request.user.id} #THIS IS THE SAME AS THE get_serializer_context method. We use this since we are over-riding the create method in the viewset
+          context = {'user_id': self.request.user.id, 'user': self.request.user} #THIS IS THE SAME AS THE get_serializer_context method. We use this since we are over-riding the create method in the viewset
        )
        serializer.is_valid(raise_exception=True)
+       if settings.ASYNC_CHECKOUT:
+          order = serializer.enqueue()
+          return Response(
+             {'id': order.id, 'payment_status': order.payment_status},
+             status=status.HTTP_202_ACCEPTED
+          )
        order = serializer.save()
        serializer = OrderSerializer(order)
        return Response(serializer.data)
@@ -144,14 +216,39 @@ class OrderViewSet(ModelViewSet):
    #THIS IS NOT NEEDED ANYMORE SINCE THE create METHOD HAS BEEN EXPLICITLY OVERRIDDEN, AND THE CONTEXT ARGUMENT HAS BEEN SUPPLIED TO THE serializer attribute in the create method 
    #  def get_serializer_context(self):
    #     return {'user_id': self.request.user.id}
+
+    def get_query_param_set (self, name):
+       # ?fields=id,placed_at and ?expand=product are comma separated lists;
+       # None means the parameter was not given
+       value = self.request.query_params.get(name)
+       if value is None:
+          return None
+       return {item.strip() for item in value.split(',') if item.strip()}
+
+    def get_serializer_context(self):
+       context = super().get_serializer_context()
+       context['fields'] = self.get_query_param_set('fields')
+       context['expand'] = self.get_query_param_set('expand')
+       return context
     
     def  get_queryset(self):
       if self.request.user.is_staff:
-         return Order.objects.all()
- 
-      (customerId, created) = Customer.objects.only('id').get_or_create(user_id = self.request.user.id)
-      # print(customerId)
-      return Order.objects.filter(customer_id = customerId)
+         queryset = Order.objects.all()
+      else:
+         queryset = Order.objects.filter(customer_id = get_customer_id(self.request.user))
+      return self.plan_queryset(queryset)
+
+    def plan_queryset (self, queryset):
+      # Load the items (and their products, when expanded) with one batched
+      # query each instead of one query per order and per item
+      fields = self.get_query_param_set('fields')
+      if fields is not None and 'orderitem_set' not in fields:
+         return queryset
+      expand = self.get_query_param_set('expand')
+      items = OrderItem.objects.all()
+      if expand is None or 'product' in expand:
+         items = items.select_related('product').prefetch_related('product__promotions')
+      return queryset.prefetch_related(Prefetch('orderitem_set', queryset=items))
        
     
 
@@ -195,9 +292,11 @@ class ProductDetail (APIView):
 
 # THIS IS A FUNCTION BASED VIEW 
 @api_view(['GET', 'POST', 'PUT', 'DELETE'])
+@conditional_catalog_response(lambda request: Product.objects.all())
+@cache_catalog_response
 def collection_list (request):
    if request.method == 'GET':
-      queryset = Collection.objects.annotate(n_products= Count('product')).all()
+      queryset = Collection.objects.all()
 
       serializer = CollectionSerializer(queryset, many=True)
      
@@ -210,14 +309,12 @@ def collection_list (request):
       return Response(serializer.data, status= status.HTTP_201_CREATED)
 
 @api_view(['GET', 'PUT', 'DELETE']) 
+@conditional_catalog_response(lambda request, id: Product.objects.filter(collection_id=id))
+@cache_catalog_response
 def collection_details (request, id):
    if request.method == 'GET':
-      collection = get_object_or_404(
-         Collection.objects.annotate(n_products= Count('product'))  , 
-         pk=id)
+      collection = get_object_or_404(Collection, pk=id)
       serializer = CollectionSerializer(collection) 
-      print('products', collection.product_set.count())
-      # print('products', collection.Product)
       return Response(serializer.data)
    
    elif request.method == 'PUT':
@@ -232,6 +329,48 @@ def collection_details (request, id):
       collection.delete()
       return Response(status=status.HTTP_204_NO_CONTENT)
 
+
+# Streams a whole table for analytics, e.g. /store/export/orders.ndjson
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def export (request, name, suffix):
+   # `format` would be taken by DRF for its own format suffixes
+   if name not in EXPORTS or suffix not in FORMATS:
+      raise Http404
+   response = StreamingHttpResponse(
+      export_lines(name, suffix, settings.EXPORT_CHUNK_SIZE), content_type=FORMATS[suffix]
+   )
+   response['Content-Disposition'] = f'attachment; filename="{name}.{suffix}"'
+   return response
+
+
+# Imports an uploaded `file`, e.g. POST /store/import/products.csv?dry_run=1
+@api_view(['POST'])
+@permission_classes([IsAdminUser])
+def import_catalog (request, kind, suffix):
+   if kind not in CatalogImport.serializers or suffix not in IMPORT_FORMATS:
+      raise Http404
+   upload = request.FILES.get('file')
+   if upload is None:
+      return Response({'file': ['No file was submitted.']}, status=status.HTTP_400_BAD_REQUEST)
+
+   errors = []
+   def report(line, record_errors):
+      if len(errors) < 100:
+         errors.append({'line': line, 'errors': record_errors})
+
+   stream = io.TextIOWrapper(upload.file, encoding='utf-8', errors=IMPORT_ENCODING_ERRORS, newline='')
+   result = CatalogImport(
+      kind, settings.IMPORT_BATCH_SIZE, request.query_params.get('dry_run') in ('1', 'true'), report
+   ).run(read_records(stream, suffix))
+   return Response({
+      'created': result.created,
+      'updated': result.updated,
+      'failed': result.failed,
+      # the first 100 rejected records
+      'errors': errors,
+   })
+
       
 
 # @api_view(['GET', 'POST'])
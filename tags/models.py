@@ -12,3 +12,9 @@ class TaggedItem (models.Model):
     content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey()
+
+    class Meta:
+        indexes = [
+            # Reverse lookups: the tags of one object, Product.tags prefetches
+            models.Index(fields=['content_type', 'object_id']),
+        ]